@@ -1,11 +1,21 @@
 from celery import Celery
+from celery.signals import worker_init
 import os
+from app.config import settings
+
+# Очередь для каждой задачи; задачи без записи идут в очередь по умолчанию
+TASK_QUEUES = {
+    'app.tasks.transcribe_audio_task': 'transcription',
+    'app.tasks.create_srt_from_youtube_task': 'transcription',
+    'app.tasks.create_no_vocals_task': 'no_vocals',
+    'app.tasks.refresh_proxies': 'proxy_refresh',
+}
 
 # Настройка Celery
 celery_app = Celery(
     "youtube_download",
-    broker="redis://localhost:6379/0",
-    backend="redis://localhost:6379/0",
+    broker=settings.celery_broker_url,
+    backend=settings.celery_result_backend,
     include=["app.tasks"]
 )
 
@@ -19,39 +29,35 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=30 * 60,  # 30 минут
     task_soft_time_limit=25 * 60,  # 25 минут
+    # Подтверждаем задачу только после выполнения, чтобы она не потерялась при падении воркера
+    task_acks_late=True,
+    # Неподтверждённую задачу Redis отдаёт другому воркеру через visibility_timeout (по умолчанию 1 час).
+    # Он должен быть больше самого длинного time_limit (create_no_vocals_task - 90 минут),
+    # иначе долгая задача выполнится повторно, пока первая ещё работает
+    broker_transport_options={'visibility_timeout': 2 * 60 * 60},
+    # Не резервируем задачи впрок: иначе короткие задачи ждут за длинными на занятом воркере
+    worker_prefetch_multiplier=settings.celery_prefetch_multiplier,
     task_default_queue='youtube_download',
     task_queues={
-        'youtube_download': {
-            'exchange': 'youtube_download',
-            'routing_key': 'youtube_download',
-        },
-        'transcription': {
-            'exchange': 'transcription',
-            'routing_key': 'transcription',
-        },
-        'no_vocals': {
-            'exchange': 'no_vocals',
-            'routing_key': 'no_vocals',
-        },
+        queue: {
+            'exchange': queue,
+            'routing_key': queue,
+        }
+        for queue in settings.enabled_queues
     },
     task_routes={
-        'app.tasks.transcribe_audio_task': {'queue': 'transcription'},
-        'app.tasks.create_srt_from_youtube_task': {'queue': 'transcription'},
-        'app.tasks.create_no_vocals_task': {'queue': 'no_vocals'},
+        task_name: {'queue': queue}
+        for task_name, queue in TASK_QUEUES.items()
+        if queue in settings.enabled_queues
     },
 )
 
-# Создание папок assets и подпапок если их нет
-assets_dir = "assets"
-video_dir = os.path.join(assets_dir, "video")
-srt_dir = os.path.join(assets_dir, "srt")
-nvoice_dir = os.path.join(assets_dir, "nvoice")
+if settings.celery_worker_concurrency:
+    celery_app.conf.worker_concurrency = settings.celery_worker_concurrency
+
 
-if not os.path.exists(assets_dir):
-    os.makedirs(assets_dir)
-if not os.path.exists(video_dir):
-    os.makedirs(video_dir)
-if not os.path.exists(srt_dir):
-    os.makedirs(srt_dir)
-if not os.path.exists(nvoice_dir):
-    os.makedirs(nvoice_dir)
+@worker_init.connect
+def create_assets_dirs(**kwargs):
+    """Создание папок assets и подпапок при старте воркера (не при импорте из API)"""
+    for directory in ("assets", "assets/video", "assets/srt", "assets/nvoice"):
+        os.makedirs(directory, exist_ok=True)
@@ -1,8 +1,18 @@
 import os
-from pydantic_settings import BaseSettings
+from functools import lru_cache
+from typing import List, Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
+    # Настройки читаются один раз и больше не меняются
+    model_config = SettingsConfigDict(
+        case_sensitive=False,
+        frozen=True,
+        env_file=".env",
+        extra="ignore",
+    )
+    
     # Основные настройки приложения
     app_name: str = "YouTube Download API"
     debug: bool = False
@@ -21,19 +31,41 @@ class Settings(BaseSettings):
     upload_dir: str = "assets"
     cookies_file: str = "cookies.txt"  # Путь к файлу cookies
     max_file_size: int = 100 * 1024 * 1024  # 100MB
-    proxy_storage_file: str = "proxies.json"  # Файл для сохранения прокси
+    max_concurrent_file_serves: int = 256  # Сколько файлов API отдаёт одновременно (каждый держит дескриптор)
+    rapidapi_info_cache_ttl: int = 6 * 3600  # Сколько хранится ответ RapidAPI о файле в Redis (сек), 0 - не кэшировать
     
     # Настройки прокси
     proxy_check_timeout: int = 5  # Таймаут проверки прокси в секундах
-    proxy_check_url: str = "https://httpbin.org/ip"  # URL для проверки прокси
+    proxy_tcp_check_timeout: float = 2  # Таймаут предварительной TCP-проверки прокси в секундах
+    proxy_check_url: str = "https://www.google.com/generate_204"  # URL для проверки прокси (отвечает 204 без тела)
+    proxy_check_concurrency: int = 64  # Максимум одновременных проверок прокси
+    proxy_cache_ttl: int = 24 * 3600  # Сколько живут сохранённые в Redis прокси (сек)
     
     # Настройки WhisperX
     whisperx_model: str = "medium"  # Модель WhisperX (tiny, base, small, medium, large)
     chunk_duration_minutes: int = 10  # Длительность чанка для больших файлов в минутах
+    whisperx_beam_size: int = 1  # Ширина beam search (1 - жадный поиск, быстрее всего)
+    whisperx_batch_size: int = 16  # Сколько VAD-фрагментов аудио декодируется за один проход на GPU
+    whisperx_max_models: int = 1  # Сколько моделей WhisperX держать в памяти одного процесса (LRU)
+    whisperx_models_dir: Optional[str] = None  # Папка с весами моделей WhisperX (CTranslate2), по умолчанию - кэш HuggingFace
+    whisperx_local_files_only: bool = False  # Не ходить в HuggingFace, если модели уже скачаны
+    whisperx_preload: bool = True  # Загружать модель при старте процесса воркера очереди transcription
     tmp_dir: str = "assets/tmp"  # Временная директория для задач
     
-    class Config:
-        case_sensitive = False
+    # Настройки Celery (Redis также используется как общий кэш прокси для всех воркеров)
+    celery_broker_url: str = "redis://localhost:6379/0"
+    celery_result_backend: str = "redis://localhost:6379/0"
+    # Очереди, которые объявляет приложение (ENABLED_QUEUES='["youtube_download", "transcription"]')
+    enabled_queues: List[str] = ["youtube_download", "transcription", "no_vocals", "proxy_refresh"]
+    # Задачи длинные (до 30+ минут), поэтому воркер резервирует не больше одной задачи за раз
+    celery_prefetch_multiplier: int = 1
+    celery_worker_concurrency: Optional[int] = None  # CELERY_WORKER_CONCURRENCY, по умолчанию - число CPU
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Единственный экземпляр настроек на процесс"""
+    return Settings()
 
 
-settings = Settings()
+settings = get_settings()
@@ -1,29 +1,63 @@
 import asyncio
 import aiohttp
-import json
+import orjson
 import time
-import os
-from typing import List, Dict, Optional
+import itertools
+import redis
+import logging
+from typing import List, Dict, Iterator, Optional, Tuple
 from app.config import settings
 from app.celery_app import celery_app
 
+logger = logging.getLogger(__name__)
+
+# Ключи общего кэша прокси в Redis
+PROXY_LIST_KEY = "proxies:list"
+PROXY_SAVED_AT_KEY = "proxies:saved_at"
+# Блокировка, чтобы серия отказов не запускала несколько обновлений сразу
+PROXY_REFRESH_LOCK_KEY = "proxies:refresh_lock"
+PROXY_REFRESH_LOCK_TTL = 60
+
 
 class ProxyManager:
     def __init__(self):
-        self.working_proxies: List[Dict] = []
-        self.current_proxy_index = 0
+        # Рабочие прокси по ключу (ip, port): удаление нерабочего прокси за O(1)
+        self.working_proxies: Dict[Tuple[str, int], Dict] = {}
+        # Бесконечный round-robin по рабочим прокси, пересобирается при изменении списка
+        self._cycle: Optional[Iterator[Dict]] = None
         self.last_proxy_update = 0
-        self.proxy_storage_file = settings.proxy_storage_file
+        # Redis брокера Celery - общий кэш прокси для всех воркеров
+        self.redis = redis.Redis.from_url(settings.celery_broker_url)
         
+    @staticmethod
+    def _proxy_key(proxy: Dict) -> Tuple[str, int]:
+        """Ключ прокси в словаре рабочих прокси"""
+        return proxy.get('ip'), proxy.get('port')
+    
+    def _set_working_proxies(self, proxies: List[Dict]):
+        """Заменяем список рабочих прокси"""
+        # URL для yt-dlp собираем один раз, а не на каждую загрузку
+        for proxy in proxies:
+            # webshare.io прокси всегда требуют аутентификацию
+            if proxy.get('username') and proxy.get('password'):
+                proxy['ytdlp_url'] = f"http://{proxy['username']}:{proxy['password']}@{proxy['ip']}:{proxy['port']}"
+            else:
+                proxy['ytdlp_url'] = f"http://{proxy['ip']}:{proxy['port']}"
+        self.working_proxies = {self._proxy_key(proxy): proxy for proxy in proxies}
+        self._rebuild_cycle()
+        self.last_proxy_update = time.time()
+    
+    def _rebuild_cycle(self):
+        """Пересобираем round-robin после изменения списка рабочих прокси"""
+        self._cycle = itertools.cycle(list(self.working_proxies.values())) if self.working_proxies else None
+    
     async def get_proxies_from_api(self) -> List[Dict]:
         """Получаем список прокси с webshare.io API"""
         try:
             headers = {"Authorization": f"Token {settings.proxy_api_key}"}
             params = settings.proxy_api_params.copy()
             
-            print(f"[PROXY DEBUG] Запрашиваем URL: {settings.proxy_api_url}")
-            print(f"[PROXY DEBUG] Параметры: {params}")
-            print(f"[PROXY DEBUG] API ключ: '{settings.proxy_api_key}'")
+            logger.debug("[PROXY] Запрашиваем URL: %s, параметры: %s", settings.proxy_api_url, params)
             
             async with aiohttp.ClientSession() as session:
                 async with session.get(
@@ -32,154 +66,169 @@ class ProxyManager:
                     params=params,
                     timeout=10
                 ) as response:
-                    print(f"[PROXY DEBUG] Статус ответа: {response.status}")
+                    logger.debug("[PROXY] Статус ответа: %s", response.status)
                     
                     if response.status == 200:
                         data = await response.json()
-                        print(f"[PROXY DEBUG] Получен ответ от API")
-                        print(f"[PROXY DEBUG] Полный ответ API: {json.dumps(data, indent=2, ensure_ascii=False)}")
-                        print(f"[PROXY DEBUG] Ключи в ответе: {list(data.keys())}")
+                        logger.debug("[PROXY] Получен ответ от API, ключи: %s", list(data.keys()))
                         
                         if 'error' in data:
-                            print(f"[PROXY DEBUG] Ошибка API прокси: {data['error']}")
+                            logger.error("[PROXY] Ошибка API прокси: %s", data['error'])
                             return []
                         
-                        # Парсим ответ webshare.io API
-                        proxies = []
-                        results = data.get('results', [])
-                        
-                        for proxy_data in results:
-                            proxy = {
-                                'ip': proxy_data.get('proxy_address'),
-                                'port': proxy_data.get('port'),
-                                'username': proxy_data.get('username'),
-                                'password': proxy_data.get('password'),
-                                'country': proxy_data.get('country_code', 'US'),
-                                'city': proxy_data.get('city'),
-                                'isp': proxy_data.get('isp'),
-                                'last_checked': proxy_data.get('last_checked'),
-                                'valid': proxy_data.get('valid', True)
+                        # Парсим ответ webshare.io API, оставляя только валидные прокси
+                        proxies = [
+                            {
+                                'ip': p['proxy_address'],
+                                'port': p['port'],
+                                'username': p.get('username'),
+                                'password': p.get('password'),
+                                'country': p.get('country_code', 'US'),
+                                'city': p.get('city'),
+                                'isp': p.get('isp'),
+                                'last_checked': p.get('last_checked'),
+                                'valid': p.get('valid', True)
                             }
-                            
-                            # Добавляем только валидные прокси
-                            if proxy['valid'] and proxy['ip'] and proxy['port']:
-                                proxies.append(proxy)
+                            for p in data.get('results', [])
+                            if p.get('valid', True) and p.get('proxy_address') and p.get('port')
+                        ]
                         
-                        print(f"Получено {len(proxies)} прокси с webshare.io API")
+                        logger.info("Получено %s прокси с webshare.io API", len(proxies))
                         return proxies
                     else:
-                        print(f"[PROXY DEBUG] Ошибка HTTP {response.status}")
-                        try:
-                            error_data = await response.json()
-                            print(f"[PROXY DEBUG] JSON ответ при ошибке: {json.dumps(error_data, indent=2, ensure_ascii=False)}")
-                        except:
-                            # Если не JSON, читаем как текст
-                            response_text = await response.text()
-                            print(f"[PROXY DEBUG] Полный текст ответа при ошибке: {response_text}")
+                        response_text = await response.text()
+                        logger.error("[PROXY] Ошибка HTTP %s: %s", response.status, response_text)
                         return []
         except Exception as e:
-            print(f"[PROXY DEBUG] Исключение при запросе прокси: {e}")
-            import traceback
-            print(f"[PROXY DEBUG] Traceback: {traceback.format_exc()}")
+            logger.exception("[PROXY] Исключение при запросе прокси: %s", e)
             return []
     
-    def save_proxies_to_file(self, proxies: List[Dict]):
-        """Сохраняем прокси в файл"""
+    def save_proxies_to_cache(self, proxies: List[Dict]):
+        """Сохраняем прокси в Redis (один pipeline вместо нескольких запросов)"""
         try:
-            proxy_data = {
-                'proxies': proxies,
-                'saved_at': time.time(),
-                'count': len(proxies)
-            }
+            pipe = self.redis.pipeline()
+            pipe.set(PROXY_LIST_KEY, orjson.dumps(proxies))
+            pipe.set(PROXY_SAVED_AT_KEY, time.time())
+            pipe.expire(PROXY_LIST_KEY, settings.proxy_cache_ttl)
+            pipe.expire(PROXY_SAVED_AT_KEY, settings.proxy_cache_ttl)
+            pipe.execute()
             
-            with open(self.proxy_storage_file, 'w', encoding='utf-8') as f:
-                json.dump(proxy_data, f, ensure_ascii=False, indent=2)
-            
-            print(f"Сохранено {len(proxies)} прокси в файл {self.proxy_storage_file}")
+            logger.info("Сохранено %s прокси в Redis (%s)", len(proxies), PROXY_LIST_KEY)
         except Exception as e:
-            print(f"Ошибка при сохранении прокси в файл: {e}")
+            logger.error("Ошибка при сохранении прокси в Redis: %s", e)
     
-    def load_proxies_from_file(self) -> List[Dict]:
-        """Загружаем прокси из файла"""
+    def update_cached_proxies(self, proxies: List[Dict]):
+        """
+        Перезаписываем сохранённый список после удаления прокси, не продлевая его срок жизни:
+        saved_at и TTL остаются прежними, иначе поток отказов бесконечно откладывал бы полное обновление
+        """
         try:
-            if not os.path.exists(self.proxy_storage_file):
-                print(f"Файл прокси {self.proxy_storage_file} не найден")
+            # xx - не воскрешаем список, уже удалённый request_refresh; keepttl - сохраняем TTL
+            self.redis.set(PROXY_LIST_KEY, orjson.dumps(proxies), xx=True, keepttl=True)
+        except Exception as e:
+            logger.error("Ошибка при обновлении прокси в Redis: %s", e)
+    
+    def load_proxies_from_cache(self) -> List[Dict]:
+        """Загружаем прокси из Redis одним запросом"""
+        try:
+            raw_proxies, raw_saved_at = self.redis.mget([PROXY_LIST_KEY, PROXY_SAVED_AT_KEY])
+            if raw_proxies is None:
+                logger.info("Прокси в Redis (%s) не найдены", PROXY_LIST_KEY)
                 return []
             
-            with open(self.proxy_storage_file, 'r', encoding='utf-8') as f:
-                proxy_data = json.load(f)
-            
-            proxies = proxy_data.get('proxies', [])
-            saved_at = proxy_data.get('saved_at', 0)
+            proxies = orjson.loads(raw_proxies)
+            saved_at = float(raw_saved_at or 0)
             
-            # Проверяем, не устарели ли прокси (старше 24 часов)
-            if time.time() - saved_at > 24 * 3600:
-                print("Сохранённые прокси устарели (старше 24 часов)")
+            # Проверяем, не устарели ли прокси
+            if time.time() - saved_at > settings.proxy_cache_ttl:
+                logger.info("Сохранённые прокси устарели")
                 return []
             
-            print(f"Загружено {len(proxies)} прокси из файла")
+            logger.info("Загружено %s прокси из Redis", len(proxies))
             return proxies
         except Exception as e:
-            print(f"Ошибка при загрузке прокси из файла: {e}")
+            logger.error("Ошибка при загрузке прокси из Redis: %s", e)
             return []
     
-    async def check_proxy(self, proxy: Dict) -> bool:
+    async def _tcp_alive(self, proxy: Dict) -> bool:
+        """Быстрая проверка: принимает ли прокси TCP-соединение"""
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(proxy['ip'], proxy['port']),
+                timeout=settings.proxy_tcp_check_timeout
+            )
+        except (asyncio.TimeoutError, OSError):
+            return False
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True
+    
+    async def check_proxy(self, session: aiohttp.ClientSession, proxy: Dict) -> bool:
         """Проверяем работоспособность прокси"""
         proxy_id = f"{proxy.get('ip', 'unknown')}:{proxy.get('port', 'unknown')}"
         try:
-            print(f"[PROXY CHECK] Начинаем проверку прокси {proxy_id}")
+            logger.debug("[PROXY CHECK] Начинаем проверку прокси %s", proxy_id)
             proxy_url = f"http://{proxy['ip']}:{proxy['port']}"
             proxy_auth = None
             
             if proxy.get('username') and proxy.get('password'):
                 proxy_auth = aiohttp.BasicAuth(proxy['username'], proxy['password'])
-                print(f"[PROXY CHECK] Прокси {proxy_id} с авторизацией")
+                logger.debug("[PROXY CHECK] Прокси %s с авторизацией", proxy_id)
             else:
-                print(f"[PROXY CHECK] Прокси {proxy_id} без авторизации")
-            
-            connector = aiohttp.TCPConnector()
-            timeout = aiohttp.ClientTimeout(total=settings.proxy_check_timeout)
+                logger.debug("[PROXY CHECK] Прокси %s без авторизации", proxy_id)
             
-            async with aiohttp.ClientSession(
-                connector=connector,
-                timeout=timeout
-            ) as session:
-                async with session.get(
-                    settings.proxy_check_url,
-                    proxy=proxy_url,
-                    proxy_auth=proxy_auth
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        print(f"[PROXY CHECK] ✓ Прокси {proxy_id} работает. IP: {result.get('origin', 'unknown')}")
-                        return True
-                    else:
-                        print(f"[PROXY CHECK] ✗ Прокси {proxy_id} вернул статус {response.status}")
-                        return False
+            # HEAD без тела ответа: достаточно убедиться, что прокси пропускает запрос
+            async with session.head(
+                settings.proxy_check_url,
+                proxy=proxy_url,
+                proxy_auth=proxy_auth,
+                allow_redirects=False
+            ) as response:
+                if response.status in (200, 204):
+                    logger.debug("[PROXY CHECK] ✓ Прокси %s работает (статус %s)", proxy_id, response.status)
+                    return True
+                else:
+                    logger.debug("[PROXY CHECK] ✗ Прокси %s вернул статус %s", proxy_id, response.status)
+                    return False
         except asyncio.TimeoutError:
-            print(f"[PROXY CHECK] ✗ Прокси {proxy_id} не работает: таймаут ({settings.proxy_check_timeout} сек)")
+            logger.debug("[PROXY CHECK] ✗ Прокси %s не работает: таймаут (%s сек)", proxy_id, settings.proxy_check_timeout)
             return False
         except aiohttp.ClientError as e:
-            print(f"[PROXY CHECK] ✗ Прокси {proxy_id} не работает (ClientError): {str(e)[:100]}")
+            logger.debug("[PROXY CHECK] ✗ Прокси %s не работает (ClientError): %s", proxy_id, str(e)[:100])
             return False
         except Exception as e:
-            print(f"[PROXY CHECK] ✗ Прокси {proxy_id} не работает (Exception): {type(e).__name__}: {str(e)[:100]}")
+            logger.debug("[PROXY CHECK] ✗ Прокси %s не работает (Exception): %s: %s", proxy_id, type(e).__name__, str(e)[:100])
             return False
     
     async def check_all_proxies(self, proxies: List[Dict]) -> List[Dict]:
-        """Проверяем все прокси параллельно"""
-        print(f"[PROXY CHECK] Начинаем проверку {len(proxies)} прокси параллельно...")
+        """Проверяем все прокси параллельно (не больше proxy_check_concurrency одновременно)"""
+        logger.info("[PROXY CHECK] Начинаем проверку %s прокси параллельно...", len(proxies))
+        
+        limit = settings.proxy_check_concurrency
+        sem = asyncio.Semaphore(limit)
         
-        tasks = [self.check_proxy(proxy) for proxy in proxies]
-        print(f"[PROXY CHECK] Создано {len(tasks)} задач для проверки")
+        async def check_with_limit(session: aiohttp.ClientSession, proxy: Dict) -> bool:
+            async with sem:
+                # Мёртвые прокси отсеиваем одним TCP-connect, не дожидаясь таймаута HTTPS-запроса
+                if not await self._tcp_alive(proxy):
+                    logger.debug("[PROXY CHECK] ✗ Прокси %s:%s не принимает TCP-соединения", proxy.get('ip'), proxy.get('port'))
+                    return False
+                return await self.check_proxy(session, proxy)
         
         try:
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            print(f"[PROXY CHECK] Получено {len(results)} результатов из {len(tasks)} задач")
+            # Одна сессия и один пул соединений на все проверки
+            connector = aiohttp.TCPConnector(limit=limit, ttl_dns_cache=300)
+            timeout = aiohttp.ClientTimeout(total=settings.proxy_check_timeout)
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                tasks = [check_with_limit(session, proxy) for proxy in proxies]
+                logger.debug("[PROXY CHECK] Создано %s задач для проверки", len(tasks))
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+            logger.debug("[PROXY CHECK] Получено %s результатов из %s задач", len(results), len(tasks))
         except Exception as e:
-            print(f"[PROXY CHECK ERROR] Ошибка при выполнении gather: {e}")
-            import traceback
-            print(f"[PROXY CHECK ERROR] Traceback: {traceback.format_exc()}")
+            logger.exception("[PROXY CHECK ERROR] Ошибка при выполнении gather: %s", e)
             return []
         
         working_proxies = []
@@ -189,122 +238,108 @@ class ProxyManager:
         for i, result in enumerate(results):
             if isinstance(result, Exception):
                 exceptions_count += 1
-                print(f"[PROXY CHECK] Задача {i} вернула исключение: {type(result).__name__}: {result}")
+                logger.debug("[PROXY CHECK] Задача %s вернула исключение: %s: %s", i, type(result).__name__, result)
             elif result is True:
                 working_proxies.append(proxies[i])
             elif result is False:
                 false_count += 1
             else:
-                print(f"[PROXY CHECK] Задача {i} вернула неожиданный результат: {result} (type: {type(result)})")
+                logger.warning("[PROXY CHECK] Задача %s вернула неожиданный результат: %s (type: %s)", i, result, type(result))
         
-        print(f"[PROXY CHECK] Итоги проверки:")
-        print(f"[PROXY CHECK]   - Рабочих: {len(working_proxies)}")
-        print(f"[PROXY CHECK]   - Не работают: {false_count}")
-        print(f"[PROXY CHECK]   - Исключения: {exceptions_count}")
-        print(f"[PROXY CHECK]   - Всего проверено: {len(working_proxies) + false_count + exceptions_count} из {len(proxies)}")
+        logger.info("[PROXY CHECK] Итоги проверки:")
+        logger.info("[PROXY CHECK]   - Рабочих: %s", len(working_proxies))
+        logger.info("[PROXY CHECK]   - Не работают: %s", false_count)
+        logger.info("[PROXY CHECK]   - Исключения: %s", exceptions_count)
+        logger.info("[PROXY CHECK]   - Всего проверено: %s из %s", len(working_proxies) + false_count + exceptions_count, len(proxies))
         
         return working_proxies
     
     async def update_working_proxies(self):
         """Обновляем список рабочих прокси"""
-        print("Обновляем список прокси...")
+        logger.info("Обновляем список прокси...")
         
         # Сначала пытаемся загрузить сохранённые прокси
-        saved_proxies = self.load_proxies_from_file()
+        # Запросы к Redis синхронные - выносим их из event loop
+        saved_proxies = await asyncio.to_thread(self.load_proxies_from_cache)
         if saved_proxies:
-            print(f"Используем {len(saved_proxies)} сохранённых прокси")
-            self.working_proxies = saved_proxies
-            self.current_proxy_index = 0
-            self.last_proxy_update = time.time()
+            logger.info("Используем %s сохранённых прокси", len(saved_proxies))
+            self._set_working_proxies(saved_proxies)
             return
         
         # Если сохранённых прокси нет, получаем новые с API
-        print(f"[PROXY] Запрашиваем прокси с API...")
-        print(f"[PROXY DEBUG] Настройки из config: API ключ='{settings.proxy_api_key[:10]}...', URL={settings.proxy_api_url}")
+        logger.info("[PROXY] Запрашиваем прокси с API...")
+        logger.debug("[PROXY] Настройки из config: URL=%s", settings.proxy_api_url)
         proxies = await self.get_proxies_from_api()
         
-        print(f"[PROXY] Получено с API: {len(proxies)} прокси")
+        logger.info("[PROXY] Получено с API: %s прокси", len(proxies))
         
         if not proxies:
-            print("[PROXY ERROR] Не удалось получить прокси с API")
+            logger.error("[PROXY ERROR] Не удалось получить прокси с API")
             return
         
         # Проверяем полученные прокси
-        print(f"[PROXY] Начинаем проверку {len(proxies)} прокси на работоспособность...")
+        logger.info("[PROXY] Начинаем проверку %s прокси на работоспособность...", len(proxies))
         working_proxies = await self.check_all_proxies(proxies)
         
-        print(f"[PROXY] Результаты проверки: {len(working_proxies)} рабочих из {len(proxies)} проверенных")
+        logger.info("[PROXY] Результаты проверки: %s рабочих из %s проверенных", len(working_proxies), len(proxies))
         
         if working_proxies:
-            # Сохраняем рабочие прокси в файл
-            self.save_proxies_to_file(working_proxies)
-            self.working_proxies = working_proxies
-            self.current_proxy_index = 0
-            self.last_proxy_update = time.time()
-            print(f"[PROXY] Обновлено: {len(self.working_proxies)} рабочих прокси сохранено и готово к использованию")
+            # Сохраняем рабочие прокси в общий кэш
+            await asyncio.to_thread(self.save_proxies_to_cache, working_proxies)
+            self._set_working_proxies(working_proxies)
+            logger.info("[PROXY] Обновлено: %s рабочих прокси сохранено и готово к использованию", len(self.working_proxies))
         else:
-            print("[PROXY ERROR] Не найдено рабочих прокси после проверки")
+            logger.error("[PROXY ERROR] Не найдено рабочих прокси после проверки")
     
     def get_next_proxy(self) -> Optional[Dict]:
         """Получаем следующий рабочий прокси"""
-        try:
-            if not self.working_proxies:
-                print(f"[PROXY] get_next_proxy: список прокси пуст (всего прокси: 0)")
-                return None
-            
-            # Проверяем, что индекс валиден (на случай если список изменился)
-            if self.current_proxy_index >= len(self.working_proxies):
-                print(f"[PROXY] get_next_proxy: индекс {self.current_proxy_index} превышает длину списка {len(self.working_proxies)}, сбрасываем на 0")
-                self.current_proxy_index = 0
-            
-            # Дополнительная проверка на случай если список стал пустым между проверками
-            if not self.working_proxies:
-                print(f"[PROXY] get_next_proxy: список прокси стал пустым после проверки индекса")
-                return None
-            
-            proxy = self.working_proxies[self.current_proxy_index]
-            print(f"[PROXY] get_next_proxy: возвращаем прокси #{self.current_proxy_index} из {len(self.working_proxies)} (IP: {proxy.get('ip')}:{proxy.get('port')})")
-            self.current_proxy_index = (self.current_proxy_index + 1) % len(self.working_proxies)
-            return proxy
-        except (IndexError, AttributeError) as e:
-            print(f"[PROXY ERROR] Ошибка при получении прокси: {e}")
-            print(f"[PROXY ERROR] Длина списка: {len(self.working_proxies) if self.working_proxies else 0}, индекс: {self.current_proxy_index}")
-            # Сбрасываем индекс для безопасности
-            self.current_proxy_index = 0
+        if self._cycle is None:
+            logger.debug("[PROXY] get_next_proxy: список прокси пуст (всего прокси: 0)")
             return None
+        
+        proxy = next(self._cycle)
+        logger.debug("[PROXY] get_next_proxy: возвращаем прокси из %s (IP: %s:%s)", len(self.working_proxies), proxy.get('ip'), proxy.get('port'))
+        return proxy
     
     def mark_proxy_failed(self, proxy: Dict):
         """Помечаем прокси как нерабочий и удаляем из списка"""
         try:
             if not proxy:
-                print(f"[PROXY] mark_proxy_failed: передан пустой прокси")
+                logger.warning("[PROXY] mark_proxy_failed: передан пустой прокси")
                 return
                 
-            if proxy in self.working_proxies:
-                self.working_proxies.remove(proxy)
-                print(f"[PROXY] Прокси {proxy.get('ip')}:{proxy.get('port')} помечен как нерабочий и удален из списка")
-                
-                # Сбрасываем индекс если он стал невалидным
-                if self.current_proxy_index >= len(self.working_proxies):
-                    print(f"[PROXY] Индекс прокси сброшен до 0 (было {self.current_proxy_index}, осталось {len(self.working_proxies)} прокси)")
-                    self.current_proxy_index = 0
+            if self.working_proxies.pop(self._proxy_key(proxy), None) is not None:
+                self._rebuild_cycle()
+                logger.info("[PROXY] Прокси %s:%s помечен как нерабочий и удален из списка", proxy.get('ip'), proxy.get('port'))
                 
-                # Обновляем сохранённый файл
+                # Обновляем общий кэш
                 if self.working_proxies:
-                    self.save_proxies_to_file(self.working_proxies)
+                    self.update_cached_proxies(list(self.working_proxies.values()))
                 
                 # Если прокси закончились, обновляем список
                 if not self.working_proxies:
-                    print("[PROXY] Все прокси закончились, обновляем список...")
-                    # Запускаем обновление асинхронно
-                    asyncio.create_task(self.update_working_proxies())
+                    logger.info("[PROXY] Все прокси закончились, обновляем список...")
+                    self.request_refresh()
             else:
-                print(f"[PROXY] Прокси {proxy.get('ip')}:{proxy.get('port')} не найден в списке (возможно уже удален)")
-        except ValueError as e:
-            print(f"[PROXY ERROR] Ошибка при удалении прокси: {e}")
-            print(f"[PROXY ERROR] Прокси не найден в списке, возможно уже был удален")
+                logger.info("[PROXY] Прокси %s:%s не найден в списке (возможно уже удален)", proxy.get('ip'), proxy.get('port'))
         except Exception as e:
-            print(f"[PROXY ERROR] Неожиданная ошибка при пометке прокси как нерабочего: {e}")
+            logger.error("[PROXY ERROR] Неожиданная ошибка при пометке прокси как нерабочего: %s", e)
+    
+    def request_refresh(self):
+        """Ставим обновление прокси в очередь Celery (не чаще одного раза за PROXY_REFRESH_LOCK_TTL)"""
+        try:
+            # Сохранённый список больше не актуален - обновление должно пойти в API
+            pipe = self.redis.pipeline()
+            pipe.delete(PROXY_LIST_KEY, PROXY_SAVED_AT_KEY)
+            pipe.set(PROXY_REFRESH_LOCK_KEY, 1, nx=True, ex=PROXY_REFRESH_LOCK_TTL)
+            _, acquired = pipe.execute()
+            if not acquired:
+                logger.info("[PROXY] Обновление прокси уже запущено, пропускаем")
+                return
+            # send_task по имени, чтобы не импортировать app.tasks (циклический импорт)
+            celery_app.send_task("app.tasks.refresh_proxies")  # очередь задаётся в task_routes
+        except Exception as e:
+            logger.error("[PROXY ERROR] Не удалось запустить обновление прокси: %s", e)
     
     def should_update_proxies(self) -> bool:
         """Проверяем, нужно ли обновить прокси"""
@@ -313,14 +348,7 @@ class ProxyManager:
     def get_proxy_for_ytdlp(self) -> Optional[str]:
         """Получаем прокси в формате для yt-dlp"""
         proxy = self.get_next_proxy()
-        if not proxy:
-            return None
-        
-        # webshare.io прокси всегда требуют аутентификацию
-        if proxy.get('username') and proxy.get('password'):
-            return f"http://{proxy['username']}:{proxy['password']}@{proxy['ip']}:{proxy['port']}"
-        else:
-            return f"http://{proxy['ip']}:{proxy['port']}"
+        return proxy['ytdlp_url'] if proxy else None
 
 
 # Глобальный экземпляр менеджера прокси
@@ -3,171 +3,262 @@
 """
 
 import os
+import re
 import time
+import random
+import shutil
 import subprocess
+import tempfile
+import orjson
+import redis
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from urllib.parse import urlparse, unquote
 from pathlib import Path
+from contextlib import contextmanager
 import logging
 
+from app.config import settings
+
 logger = logging.getLogger(__name__)
 
+# Шаблоны YouTube URL и "голого" ID видео, компилируются один раз при импорте
+_YT_ID_PATTERNS = [
+    re.compile(r'(?:youtube\.com/watch\?v=|youtu\.be/|youtube\.com/embed/)([^&\n?#]+)'),
+    re.compile(r'youtube\.com/v/([^&\n?#]+)'),
+]
+_YT_ID_RE = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+# Ключ Redis для кэша ответа RapidAPI о файле
+_INFO_CACHE_KEY = "rapidapi:info:{video_id}:{quality}"
+# Сколько ждать ссылку из кэша, прежде чем считать её устаревшей (сек)
+_CACHED_URL_MAX_WAIT = 10
+
+# Дополнительные параметры ffmpeg по формату исходного файла
+_FFMPEG_EXTRA_ARGS = {
+    '.opus': (
+        "-ar", "48000",  # Сохраняем исходную частоту дискретизации opus
+        "-avoid_negative_ts", "make_zero",  # Исправляем проблемы с временными метками
+    ),
+    '.ogg': ("-avoid_negative_ts", "make_zero"),
+}
+
+
+@contextmanager
+def _atomic_output(output_path: str):
+    """Отдаёт путь временного файла рядом с output_path и переносит его на место output_path только
+    при успешном завершении блока: при ошибке недописанный mp3 удаляется и не попадает в кэш"""
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir or ".", prefix=".", suffix=Path(output_path).suffix)
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError as e:
+                logger.warning(f"Не удалось удалить временный файл {tmp_path}: {e}")
+
 
 class RapidAPIService:
     """Сервис для скачивания YouTube аудио через RapidAPI"""
     
-    def __init__(self, api_key: str = None):
+    # Путь к ffmpeg, найденный в PATH ("" - не найден, None - ещё не искали)
+    _ffmpeg_path = None
+    
+    # Клиент Redis для кэша ответов RapidAPI, общий для процесса
+    _redis = None
+    
+    def __init__(self, api_key: str = None, compression_level: int = 5):
         self.api_key = api_key or "e7e30acb7emsh43a9ab3e385c352p1accbcjsn34a2c2ec6816"
         self.host = "youtube-video-fast-downloader-24-7.p.rapidapi.com"
         self.default_quality = "251"
         self.default_bitrate = "192k"
+        # Качество алгоритма LAME (0 - лучше и медленнее, 9 - быстрее); 5 заметно быстрее значения по умолчанию
+        self.compression_level = compression_level
         
         if not self.api_key or self.api_key == "your_rapidapi_key_here":
             logger.warning("RAPIDAPI_KEY не настроен, используйте переменную окружения или обновите config.py")
             raise ValueError("RAPIDAPI_KEY не настроен. Установите ключ в config.py или переменной окружения RAPIDAPI_KEY")
+        
+        # Заголовки только для RapidAPI: ключ не должен уходить на CDN с файлами
+        self.api_headers = {
+            "x-rapidapi-host": self.host,
+            "x-rapidapi-key": self.api_key,
+            "Accept": "application/json",
+        }
+        
+        # Постоянная сессия: keep-alive и пул соединений к RapidAPI и CDN вместо нового TLS на каждый запрос
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        # Для RapidAPI повторы делает urllib3: экспоненциальная задержка, учёт Retry-After при 429,
+        # соединение из пула переиспользуется между попытками. CDN с файлами опрашивается своим циклом
+        retry = Retry(
+            total=3,
+            backoff_factor=2,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.session.mount(f"https://{self.host}/", HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=retry))
+    
+    def close(self):
+        """Закрывает HTTP сессию"""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def get_video_id_from_url(self, url: str) -> str:
         """Извлекает ID видео из YouTube URL"""
-        import re
-        
-        patterns = [
-            r'(?:youtube\.com/watch\?v=|youtu\.be/|youtube\.com/embed/)([^&\n?#]+)',
-            r'youtube\.com/v/([^&\n?#]+)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, url)
+        for pattern in _YT_ID_PATTERNS:
+            match = pattern.search(url)
             if match:
                 return match.group(1)
         
         # Если не найден, возможно это уже ID
-        if len(url) == 11 and url.replace('-', '').replace('_', '').isalnum():
+        if _YT_ID_RE.match(url):
             return url
             
         raise ValueError(f"Не удалось извлечь ID видео из URL: {url}")
     
-    def get_info_from_rapidapi(self, video_id: str, quality: str = None, timeout: int = 60, max_retries: int = 3) -> dict:
-        """Получает информацию о файле от RapidAPI с повторными попытками"""
+    def get_info_from_rapidapi(self, video_id: str, quality: str = None, timeout: int = 60) -> dict:
+        """Получает информацию о файле от RapidAPI (повторы выполняет адаптер сессии)"""
         quality = quality or self.default_quality
         url = f"https://{self.host}/download_audio/{video_id}"
         
-        headers = {
-            "x-rapidapi-host": self.host,
-            "x-rapidapi-key": self.api_key,
-            "Accept": "application/json",
-        }
+        logger.info(f"Запрашиваем информацию от RapidAPI для видео {video_id} (таймаут: {timeout}s)")
         
-        logger.info(f"Запрашиваем информацию от RapidAPI для видео {video_id} (таймаут: {timeout}s, попыток: {max_retries})")
+        try:
+            resp = self.session.get(url, headers=self.api_headers, params={"quality": quality}, timeout=timeout)
+            resp.raise_for_status()
+            return orjson.loads(resp.content)
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
+            logger.error(f"Не удалось получить информацию от RapidAPI: {e}")
+            raise
+    
+    @classmethod
+    def _get_redis(cls) -> redis.Redis:
+        if cls._redis is None:
+            cls._redis = redis.Redis.from_url(settings.celery_broker_url)
+        return cls._redis
+    
+    def get_info_cached(self, video_id: str, quality: str = None, timeout: int = 60, refresh: bool = False):
+        """
+        get_info_from_rapidapi с кэшем в Redis: параллельные и повторные задачи для того же видео
+        не тратят запрос к RapidAPI. refresh=True пропускает чтение кэша и перезаписывает запись.
         
-        last_exception = None
+        Returns:
+            tuple: (info, из кэша ли ответ)
+        """
+        ttl = settings.rapidapi_info_cache_ttl
+        if ttl <= 0:
+            return self.get_info_from_rapidapi(video_id, quality, timeout=timeout), False
         
-        for attempt in range(max_retries):
+        key = _INFO_CACHE_KEY.format(video_id=video_id, quality=quality or self.default_quality)
+        if not refresh:
             try:
-                logger.info(f"Попытка {attempt + 1}/{max_retries}")
-                resp = requests.get(url, headers=headers, params={"quality": quality}, timeout=timeout)
-                resp.raise_for_status()
-                logger.info(f"Успешно получена информация от RapidAPI на попытке {attempt + 1}")
-                return resp.json()
-            except requests.RequestException as e:
-                last_exception = e
-                logger.warning(f"Попытка {attempt + 1}/{max_retries} неудачна: {e}")
-                if attempt < max_retries - 1:
-                    wait_time = (attempt + 1) * 2  # Экспоненциальная задержка: 2, 4, 6 секунд
-                    logger.info(f"Ждем {wait_time} секунд перед следующей попыткой...")
-                    time.sleep(wait_time)
+                cached = self._get_redis().get(key)
+            except redis.RedisError as e:
+                logger.warning("Кэш RapidAPI недоступен: %s", e)
+                return self.get_info_from_rapidapi(video_id, quality, timeout=timeout), False
+            
+            if cached:
+                logger.info("Информация RapidAPI для %s взята из кэша", video_id)
+                return orjson.loads(cached), True
         
-        logger.error(f"Все {max_retries} попыток неудачны. Последняя ошибка: {last_exception}")
-        raise last_exception
+        info = self.get_info_from_rapidapi(video_id, quality, timeout=timeout)
+        # Кэшируем только ответы со ссылкой на файл
+        if info.get("file") or info.get("url"):
+            try:
+                self._get_redis().set(key, orjson.dumps(info), ex=ttl)
+            except redis.RedisError as e:
+                logger.warning("Не удалось сохранить ответ RapidAPI в кэш: %s", e)
+        return info, False
+    
+    def invalidate_info(self, video_id: str, quality: str = None):
+        """Удаляет ответ RapidAPI из кэша (ссылка на файл оказалась нерабочей)"""
+        try:
+            self._get_redis().delete(_INFO_CACHE_KEY.format(video_id=video_id, quality=quality or self.default_quality))
+        except redis.RedisError as e:
+            logger.warning("Не удалось очистить кэш RapidAPI: %s", e)
     
     def wait_for_file_url(self, file_url: str, max_wait: int = 600, referer: str = None) -> bool:
         """
-        Ждет пока файл станет доступен по URL
+        Ждет пока файл станет доступен по URL (экспоненциальная задержка с джиттером: 1, 2, 4, ... 30 с)
         """
-        start = time.time()
+        deadline = time.monotonic() + max_wait
         attempt = 0
         
+        headers = {"Connection": "keep-alive"}
+        if referer:
+            headers["Referer"] = referer
+        
         logger.info(f"Ожидаем доступности файла: {file_url}")
         
         while True:
             attempt += 1
-            headers = {}
-            if referer:
-                headers["Referer"] = referer
             
             try:
-                # Сначала пробуем HEAD запрос
-                r = requests.head(file_url, headers=headers, allow_redirects=True, timeout=10)
+                # Один GET с Range 0-0 вместо HEAD + GET: CDN отвечают на него надёжнее, тело не читаем
+                with self.session.get(file_url, headers={**headers, "Range": "bytes=0-0"}, timeout=10,
+                                      stream=True, allow_redirects=True) as r:
+                    status = r.status_code
                 
-                if r.status_code == 200:
+                if status in (200, 206):
                     logger.info("Файл доступен!")
                     return True
                 
-                if r.status_code == 404:
-                    elapsed = time.time() - start
-                    if elapsed > max_wait:
-                        logger.error("Превышено время ожидания файла")
-                        return False
-                    
-                    wait = min(2 * attempt, 30)
-                    logger.info(f"Файл не готов (404). Ждем {wait}s...")
-                    time.sleep(wait)
-                    continue
-                
-                # Для других статусов пробуем GET с Range
-                if r.status_code in (403, 401):
-                    logger.warning(f"HEAD вернул {r.status_code} - возможно нужны cookies/авторизация")
+                if status in (403, 401):
+                    logger.warning(f"GET вернул {status} - нужны cookies/headers")
                     return False
                 
-                # Пробуем GET с Range 0-0
-                r2 = requests.get(file_url, headers={**headers, "Range": "bytes=0-0"}, timeout=10, stream=True)
-                
-                if r2.status_code in (200, 206):
-                    logger.info("Файл доступен!")
-                    return True
-                
-                if r2.status_code == 404:
-                    elapsed = time.time() - start
-                    if elapsed > max_wait:
-                        logger.error("Превышено время ожидания файла")
-                        return False
-                    time.sleep(min(2 * attempt, 30))
-                    continue
-                
-                if r2.status_code in (403, 401):
-                    logger.warning(f"GET вернул {r2.status_code} - нужны cookies/headers")
-                    return False
-                    
+                logger.info(f"Файл не готов ({status})")
             except requests.RequestException as e:
-                elapsed = time.time() - start
-                if elapsed > max_wait:
-                    logger.error(f"Таймаут ожидания файла: {e}")
-                    return False
-                time.sleep(min(2 * attempt, 15))
-                continue
+                logger.warning(f"Ошибка при проверке доступности файла: {e}")
+            
+            wait = min(30, 1 << min(attempt - 1, 5)) + random.uniform(0, 0.5)
+            if time.monotonic() + wait > deadline:
+                logger.error("Превышено время ожидания файла")
+                return False
+            
+            logger.info(f"Ждем {wait:.1f}s...")
+            time.sleep(wait)
     
     def download_and_convert_to_mp3(self, file_url: str, output_path: str, bitrate: str = None, referer: str = None) -> str:
         """Скачивает файл и конвертирует в MP3 через ffmpeg"""
-        import tempfile
-        
         bitrate = bitrate or self.default_bitrate
         
         # Проверяем наличие ffmpeg
         if not self._check_ffmpeg():
             raise RuntimeError("ffmpeg не найден в PATH. Установите ffmpeg.")
         
-        # Определяем формат файла по расширению URL
-        file_ext = None
-        if '.opus' in file_url.lower():
-            file_ext = '.opus'
-        elif '.ogg' in file_url.lower():
-            file_ext = '.ogg'
-        elif '.webm' in file_url.lower():
-            file_ext = '.webm'
+        # Определяем формат файла по расширению пути в URL (без query-строки)
+        url_path = urlparse(file_url).path.lower()
+        file_ext = next((ext for ext in ('.opus', '.ogg', '.webm') if url_path.endswith(ext)), None)
         
-        # Если это opus/ogg/webm, сначала скачиваем файл полностью, затем конвертируем
-        # Это необходимо для правильной обработки длительности при конвертации
+        # Если это opus/ogg/webm, подаём тело ответа прямо в stdin ffmpeg: декодирование идёт параллельно со скачиванием.
+        # Если потоковая конвертация не удалась (контейнеру нужна перемотка), скачиваем файл полностью, затем конвертируем
         if file_ext in ['.opus', '.ogg', '.webm']:
-            logger.info(f"Обнаружен формат {file_ext}, сначала скачиваем файл полностью на диск")
+            try:
+                return self._stream_url_to_mp3(file_url, output_path, bitrate, file_ext, referer)
+            except requests.RequestException:
+                # Ошибка HTTP/сети (это подкласс OSError): повторное скачивание на диск упадёт так же
+                raise
+            except (RuntimeError, OSError, subprocess.TimeoutExpired) as e:
+                logger.warning(f"Потоковая конвертация {file_ext} не удалась ({e}), скачиваем файл полностью на диск")
             
             # Создаем временный файл для скачивания
             temp_input = tempfile.NamedTemporaryFile(delete=False, suffix=file_ext)
@@ -177,13 +268,13 @@ class RapidAPIService:
             try:
                 # Скачиваем файл полностью
                 logger.info(f"Скачиваем файл: {file_url}")
-                response = requests.get(file_url, stream=True, timeout=300, headers={"Referer": referer} if referer else {})
-                response.raise_for_status()
-                
-                with open(temp_input_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
+                with self.session.get(file_url, stream=True, timeout=300, headers={"Referer": referer} if referer else {}) as response:
+                    response.raise_for_status()
+                    
+                    # Копируем тело ответа на диск блоками по 1 МБ. iter_content, а не response.raw: обрыв соединения
+                    # посреди тела приходит как requests.RequestException, а не как исключение urllib3
+                    with open(temp_input_path, 'wb', buffering=1 << 20) as f:
+                        f.writelines(response.iter_content(1 << 20))
                 
                 actual_size = os.path.getsize(temp_input_path)
                 if actual_size == 0:
@@ -204,7 +295,7 @@ class RapidAPIService:
         
         else:
             # Для других форматов (MP3, M4A) используем прямой поток из URL
-            cmd = ["ffmpeg", "-y"]
+            cmd = [self._ffmpeg_path, "-y"]
             
             # Добавляем заголовки если нужно
             if referer:
@@ -214,69 +305,92 @@ class RapidAPIService:
             cmd += [
                 "-i", file_url,
                 "-vn",  # Без видео
-                "-c:a", "libmp3lame",
-                "-b:a", bitrate,
-                str(output_path)
+                *self._mp3_encode_args(bitrate),
             ]
             
-            logger.info(f"Запускаем ffmpeg (поток из URL): {' '.join(cmd)}")
+            logger.info(f"Запускаем ffmpeg (поток из URL): {' '.join(cmd)} {output_path}")
             
             try:
-                result = subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=600)
+                with _atomic_output(output_path) as tmp_output:
+                    result = subprocess.run([*cmd, tmp_output], check=True, capture_output=True, text=True, timeout=600)
                 logger.info(f"Конвертация завершена: {output_path}")
                 return output_path
             except subprocess.CalledProcessError as e:
                 logger.error(f"Ошибка ffmpeg: {e.stderr}")
                 raise
     
-    def _convert_local_file_to_mp3(self, input_path: str, output_path: str, bitrate: str, file_ext: str) -> str:
-        """Конвертирует локальный файл в MP3"""
-        # Создаем директорию для выходного файла если её нет
-        output_dir = os.path.dirname(output_path)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir, exist_ok=True)
-        
-        cmd = ["ffmpeg", "-y"]
+    def _stream_url_to_mp3(self, file_url: str, output_path: str, bitrate: str, file_ext: str, referer: str = None) -> str:
+        """Скачивает файл и одновременно конвертирует его в MP3, передавая поток в stdin ffmpeg"""
+        input_format = {'.opus': 'ogg', '.ogg': 'ogg', '.webm': 'matroska'}[file_ext]
         
-        # Специальные параметры для opus/ogg файлов
-        if file_ext in ['.opus', '.ogg']:
-            cmd.extend([
-                "-i", input_path,
-                "-vn",  # Без видео
-                "-c:a", "libmp3lame",
-                "-b:a", bitrate,
-                "-ar", "48000",  # Сохраняем исходную частоту дискретизации opus
-                "-avoid_negative_ts", "make_zero",  # Исправляем проблемы с временными метками
-            ])
-        elif file_ext == '.webm':
-            cmd.extend([
-                "-i", input_path,
-                "-vn",  # Без видео
-                "-c:a", "libmp3lame",
-                "-b:a", bitrate,
-            ])
-        else:
-            cmd.extend([
-                "-i", input_path,
-                "-vn",  # Без видео
-                "-c:a", "libmp3lame",
-                "-b:a", bitrate,
-            ])
-        
-        cmd.append(str(output_path))
+        cmd = [
+            self._ffmpeg_path, "-y",
+            "-f", input_format,
+            "-i", "pipe:0",
+            "-vn",  # Без видео
+            *self._mp3_encode_args(bitrate),
+            *_FFMPEG_EXTRA_ARGS.get(file_ext, ()),
+        ]
         
-        logger.info(f"Запускаем ffmpeg (локальный файл): {' '.join(cmd)}")
+        logger.info(f"Запускаем ffmpeg (поток в stdin): {' '.join(cmd)} {output_path}")
         
-        try:
-            result = subprocess.run(cmd, check=True, capture_output=True, text=True, timeout=600)
+        # ffmpeg пишет во временный файл, который заменяет output_path только после успешной конвертации.
+        # stderr пишем во временный файл: PIPE может переполниться, пока мы пишем в stdin
+        with _atomic_output(output_path) as tmp_output, tempfile.TemporaryFile() as stderr_file:
+            proc = subprocess.Popen([*cmd, tmp_output], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr_file)
+            try:
+                with self.session.get(file_url, stream=True, timeout=300, headers={"Referer": referer} if referer else {}) as response:
+                    response.raise_for_status()
+                    # iter_content оборачивает ошибки urllib3 в исключения requests
+                    proc.stdin.writelines(response.iter_content(1 << 20))
+                proc.stdin.close()
+                proc.wait(timeout=600)
+            except BaseException:
+                proc.kill()
+                proc.wait()
+                raise
             
-            # Проверяем, что выходной файл создан и не пустой
-            if not os.path.exists(output_path):
-                raise RuntimeError(f"Выходной файл не был создан: {output_path}")
+            if proc.returncode != 0:
+                stderr_file.seek(0)
+                stderr = stderr_file.read().decode(errors="replace")
+                raise RuntimeError(f"ffmpeg завершился с кодом {proc.returncode}: {stderr[-2000:]}")
             
-            output_size = os.path.getsize(output_path)
-            if output_size == 0:
+            if os.path.getsize(tmp_output) == 0:
                 raise RuntimeError(f"Выходной файл пустой: {output_path}")
+        
+        logger.info(f"Потоковая конвертация завершена: {output_path} ({os.path.getsize(output_path) / 1024 / 1024:.2f} МБ)")
+        return output_path
+    
+    def _mp3_encode_args(self, bitrate: str) -> list:
+        """Параметры кодирования в MP3 для ffmpeg"""
+        return [
+            "-c:a", "libmp3lame",
+            "-b:a", bitrate,
+            "-compression_level", str(self.compression_level),
+            "-threads", "0",  # ffmpeg сам распараллеливает демультиплексирование/ресемплинг
+        ]
+    
+    def _convert_local_file_to_mp3(self, input_path: str, output_path: str, bitrate: str, file_ext: str) -> str:
+        """Конвертирует локальный файл в MP3"""
+        cmd = [
+            self._ffmpeg_path, "-y",
+            "-i", input_path,
+            "-vn",  # Без видео
+            *self._mp3_encode_args(bitrate),
+            *_FFMPEG_EXTRA_ARGS.get(file_ext, ()),
+        ]
+        
+        logger.info(f"Запускаем ffmpeg (локальный файл): {' '.join(cmd)} {output_path}")
+        
+        try:
+            # Выходной файл появляется на месте output_path только после успешной конвертации
+            with _atomic_output(output_path) as tmp_output:
+                result = subprocess.run([*cmd, tmp_output], check=True, capture_output=True, text=True, timeout=600)
+                
+                # Проверяем, что выходной файл не пустой
+                output_size = os.path.getsize(tmp_output)
+                if output_size == 0:
+                    raise RuntimeError(f"Выходной файл пустой: {output_path}")
             
             logger.info(f"Конвертация завершена: {output_path} ({output_size / 1024 / 1024:.2f} МБ)")
             return output_path
@@ -288,13 +402,20 @@ class RapidAPIService:
             logger.error(f"Stdout: {e.stdout}")
             raise
     
-    def _check_ffmpeg(self) -> bool:
-        """Проверяет наличие ffmpeg в системе"""
-        try:
-            subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True)
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return False
+    @classmethod
+    def _check_ffmpeg(cls) -> bool:
+        """Проверяет наличие ffmpeg в системе (путь ищется один раз на процесс)"""
+        if cls._ffmpeg_path is None:
+            cls._ffmpeg_path = shutil.which("ffmpeg") or ""
+        return bool(cls._ffmpeg_path)
+    
+    @staticmethod
+    def _file_url_from_info(info: dict) -> str:
+        file_url = info.get("file") or info.get("url")
+        if not file_url:
+            raise ValueError(f"RapidAPI вернул ответ без file/url: {info}")
+        logger.info("URL файла: %s", file_url)
+        return file_url
     
     def download_youtube_audio(self, url: str, output_path: str, quality: str = None, bitrate: str = None) -> str:
         """
@@ -314,22 +435,34 @@ class RapidAPIService:
             video_id = self.get_video_id_from_url(url)
             logger.info(f"ID видео: {video_id}")
             
-            # Получаем информацию от RapidAPI
-            info = self.get_info_from_rapidapi(video_id, quality, timeout=60, max_retries=3)
-            
-            file_url = info.get("file") or info.get("url")
-            if not file_url:
-                raise ValueError(f"RapidAPI вернул ответ без file/url: {info}")
+            # Получаем информацию от RapidAPI (или из кэша)
+            info, cached = self.get_info_cached(video_id, quality, timeout=60)
+            file_url = self._file_url_from_info(info)
             
-            logger.info(f"URL файла: {file_url}")
-            
-            # Ждем пока файл станет доступен
-            if not self.wait_for_file_url(file_url):
-                raise RuntimeError("Файл не стал доступен в течение указанного времени")
-            
-            # Скачиваем и конвертируем в MP3
-            return self.download_and_convert_to_mp3(file_url, output_path, bitrate)
+            try:
+                # Ссылка из кэша обычно уже готова: если она не отвечает за несколько секунд, считаем её
+                # устаревшей - не ждём полный таймаут, а один раз берём у RapidAPI новую
+                if cached and not self.wait_for_file_url(file_url, max_wait=_CACHED_URL_MAX_WAIT):
+                    logger.info("Ссылка из кэша для %s не отвечает, запрашиваем новую", video_id)
+                    info, cached = self.get_info_cached(video_id, quality, timeout=60, refresh=True)
+                    file_url = self._file_url_from_info(info)
+                
+                # Ждем пока файл станет доступен
+                if not cached and not self.wait_for_file_url(file_url):
+                    raise RuntimeError("Файл не стал доступен в течение указанного времени")
+                
+                # Скачиваем и конвертируем в MP3
+                return self.download_and_convert_to_mp3(file_url, output_path, bitrate)
+            except Exception:
+                # Ссылка могла устареть - следующая попытка запросит новую
+                self.invalidate_info(video_id, quality)
+                raise
             
+        except FileNotFoundError as e:
+            # ffmpeg мог пропасть из PATH - при следующем вызове ищем его заново
+            type(self)._ffmpeg_path = None
+            logger.error(f"Ошибка скачивания YouTube аудио: {e}")
+            raise
         except Exception as e:
             logger.error(f"Ошибка скачивания YouTube аудио: {e}")
             raise
@@ -1,14 +1,26 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, HttpUrl
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
+from pydantic import AfterValidator, BaseModel
+import asyncio
+import hashlib
+import orjson
 import os
+import re
+import time
+import redis.asyncio as aioredis
+import stat
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 
+from starlette.datastructures import Headers
+
 from app.tasks import download_video_task, transcribe_audio_task, extract_youtube_id, create_srt_from_youtube_task
 from app.config import settings
-from typing import Optional
+from app.celery_app import celery_app
+from typing import Annotated, Optional
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 def _get_assets_dir() -> Path:
@@ -19,11 +31,184 @@ def _get_assets_dir() -> Path:
     return Path(__file__).resolve().parent.parent.parent / raw
 
 
-_ASSETS_DIR = _get_assets_dir()
+# Корень и подпапки вычисляются один раз при импорте, а не на каждый запрос
+_ASSETS_DIR = _get_assets_dir().resolve()
+_VIDEO_DIR = _ASSETS_DIR / "video"
+_SRT_DIR = _ASSETS_DIR / "srt"
+_NVOICE_DIR = _ASSETS_DIR / "nvoice"
+# Строковые варианты для os.scandir/os.stat - без преобразования Path на каждый вызов
+_VIDEO_DIR_S = str(_VIDEO_DIR)
+_SRT_DIR_S = str(_SRT_DIR)
+_NVOICE_DIR_S = str(_NVOICE_DIR)
+
+
+# Префикс ссылок на скачивание в ответах API
+_FILE_URL_PREFIX = "/api/v1/download/file/"
+
+# Порядок поиска файла в download_file
+_FILE_DIRS = (_VIDEO_DIR, _SRT_DIR, _NVOICE_DIR)
+_NO_VOCALS_FILE_DIRS = (_NVOICE_DIR,)
+
+
+def _check_asset_name(filename: str) -> None:
+    """Разрешены только имена файлов непосредственно в папках assets: без разделителей пути,
+    скрытых файлов и NUL. Проверка чисто строковая, без обращений к файловой системе."""
+    if "/" in filename or "\\" in filename or filename.startswith(".") or "\0" in filename:
+        raise HTTPException(status_code=400, detail="Недопустимое имя файла")
+
+
+# Ограничение одновременно отдаваемых файлов: не исчерпываем дескрипторы процесса (EMFILE) под нагрузкой
+_FILE_SERVE_SEM = asyncio.BoundedSemaphore(settings.max_concurrent_file_serves)
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Совпадает ли ETag с одним из значений If-None-Match (слабое сравнение)"""
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class _AssetFileResponse(FileResponse):
+    """FileResponse с блоками по 1 МБ вместо 64 КБ: меньше системных вызовов на больших MP3.
+    Если ASGI-сервер поддерживает расширение http.response.pathsend (Granian, Hypercorn),
+    файл целиком отдаёт сервер через sendfile, минуя чтение блоками в Python."""
+    chunk_size = 1024 * 1024
+    
+    def _is_not_modified(self, request_headers: Headers) -> bool:
+        """Проверка If-None-Match / If-Modified-Since по ETag и Last-Modified из stat_result"""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            etag = self.headers.get("etag")
+            return etag is not None and _etag_matches(if_none_match, etag)
+        
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since and self.stat_result is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return int(self.stat_result.st_mtime) <= since.timestamp()
+        return False
+    
+    async def __call__(self, scope, receive, send):
+        if scope.get("method") in ("GET", "HEAD") and self._is_not_modified(Headers(scope=scope)):
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [
+                    (name, value) for name, value in self.raw_headers
+                    if name in (b"etag", b"last-modified")
+                ],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+        
+        # Файл открыт только пока ответ отправляется, поэтому ограничиваем именно отправку, а не обработчик
+        async with _FILE_SERVE_SEM:
+            # HEAD и Range-запросы (докачка) обрабатывает стандартная реализация
+            if (
+                "http.response.pathsend" not in scope.get("extensions", {})
+                or scope.get("method") == "HEAD"
+                or any(name == b"range" for name, _ in scope.get("headers", ()))
+            ):
+                await super().__call__(scope, receive, send)
+                return
+            
+            # Заголовки (content-length, content-disposition) уже заполнены по stat_result в __init__
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+
+
+def _find_asset(candidates: list):
+    """Возвращает (путь, stat) первого существующего файла из candidates или (None, None)"""
+    for path in candidates:
+        try:
+            stat_result = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        if stat.S_ISREG(stat_result.st_mode):
+            return path, stat_result
+    return None, None
+
+
+def _fetch_task_statuses(task_ids: list) -> dict:
+    """Читает состояния нескольких задач одним MGET к result backend: {task_id: (state, info)}"""
+    backend = celery_app.backend
+    values = backend.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+    statuses = {}
+    for task_id, value in zip(task_ids, values):
+        if value is None:
+            # Нет записи в backend - задача ещё не начата или неизвестна
+            statuses[task_id] = ('PENDING', None)
+        else:
+            # decode_result восстанавливает исключение для FAILURE так же, как AsyncResult.info
+            meta = backend.decode_result(value)
+            statuses[task_id] = (meta['status'], meta['result'])
+    return statuses
+
+
+def _fetch_task_status(task_id: str):
+    """Читает состояние задачи из result backend одним запросом и возвращает (state, info)"""
+    # AsyncResult для незавершённой задачи ходит в backend отдельно за state и за info
+    return _fetch_task_statuses([task_id])[task_id]
+
+
+# Состояния незавершённой задачи: STARTED (task_track_started) и RETRY (self.retry при временном сбое)
+# - это ещё не результат, клиенту они показываются как выполнение, а long-poll продолжает ждать
+_IN_PROGRESS_STATES = ('PENDING', 'STARTED', 'RETRY', 'PROGRESS')
+
+
+# Общий пул соединений к result backend для long-poll подписок (соединение не открывается до первого запроса)
+_RESULT_REDIS_POOL = aioredis.ConnectionPool.from_url(settings.celery_result_backend)
+
+
+async def _wait_task_status(task_id: str, wait: float):
+    """
+    Long-poll: если задача ещё не завершена, ждёт до wait секунд её следующего обновления
+    и возвращает (state, info). Redis backend Celery публикует каждое сохранение состояния
+    в канал с тем же именем, что и ключ результата, поэтому подписка срабатывает сразу после update_state.
+    """
+    client = aioredis.Redis(connection_pool=_RESULT_REDIS_POOL)
+    pubsub = client.pubsub()
+    try:
+        # Подписываемся до чтения состояния, чтобы не пропустить обновление между ними
+        # Имя канала берём у backend: оно учитывает global_keyprefix, если он настроен
+        await pubsub.subscribe(celery_app.backend.get_key_for_task(task_id))
+        state, task_info = await asyncio.to_thread(_fetch_task_status, task_id)
+        if state not in _IN_PROGRESS_STATES:
+            return state, task_info
+        
+        deadline = time.monotonic() + wait
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message is not None:
+                break
+    finally:
+        await pubsub.aclose()
+    
+    return await asyncio.to_thread(_fetch_task_status, task_id)
+
+
+# Допустимые размеры модели WhisperX для /srt
+_VALID_MODEL_SIZES = ("tiny", "base", "small", "medium", "large")
+
+# Ссылка на YouTube: проверяется один раз при разборе запроса и дальше используется как обычная строка
+_YT_URL_RE = re.compile(r"^https?://(?:www\.|m\.|music\.)?(?:youtube\.com|youtu\.be)/\S+$", re.IGNORECASE)
+
+
+def _validate_youtube_url(value: str) -> str:
+    value = value.strip()
+    if not _YT_URL_RE.match(value):
+        raise ValueError("Ожидается ссылка на YouTube (youtube.com или youtu.be)")
+    return value
+
+
+YoutubeUrl = Annotated[str, AfterValidator(_validate_youtube_url)]
 
 
 class DownloadRequest(BaseModel):
-    youtube_url: HttpUrl
+    youtube_url: YoutubeUrl
     audio_only: bool = False
 
 
@@ -35,7 +220,7 @@ class DownloadResponse(BaseModel):
 
 
 class SRTRequest(BaseModel):
-    youtube_url: HttpUrl
+    youtube_url: YoutubeUrl
     model_size: Optional[str] = "medium"  # tiny, base, small, medium, large
 
 
@@ -51,12 +236,12 @@ async def download_video(request: DownloadRequest):
     """Загрузить видео или аудио с YouTube"""
     try:
         # Отправляем задачу в Celery
-        task = download_video_task.delay(str(request.youtube_url), request.audio_only)
+        task = download_video_task.delay(request.youtube_url, request.audio_only)
         
         download_type = "аудио" if request.audio_only else "видео"
         return DownloadResponse(
             task_id=task.id,
-            youtube_url=str(request.youtube_url),
+            youtube_url=request.youtube_url,
             status="pending",
             message=f"Задача загрузки {download_type} создана"
         )
@@ -64,70 +249,136 @@ async def download_video(request: DownloadRequest):
         raise HTTPException(status_code=400, detail=f"Ошибка создания задачи: {str(e)}")
 
 
+def _as_dict(value, for_error: bool = False) -> dict:
+    """
+    info/result задачи как словарь. Не-словарь заменяется пустым словарём, а для ошибок
+    (for_error=True) - описанием исключения.
+    """
+    if isinstance(value, dict):
+        return value
+    if not for_error:
+        return {}
+    return {
+        'error': str(value) if value else 'Неизвестная ошибка',
+        'exc_type': type(value).__name__ if value else 'Unknown'
+    }
+
+
+def _render_task_status(task_id: str, state: str, task_info, progress_default: str,
+                        progress_extra=None, success_extra=None) -> dict:
+    """
+    Формирует ответ о статусе задачи. Общие поля одинаковы для всех задач,
+    progress_extra(info) и success_extra(result) добавляют поля конкретной задачи.
+    """
+    if state == 'PENDING':
+        response = {
+            'task_id': task_id,
+            'state': state,
+            'status': 'Ожидание...',
+            'progress': 0
+        }
+    elif state in ('STARTED', 'RETRY'):
+        # info у них - служебные данные воркера или исключение повторяемой попытки, клиенту не показываем
+        response = {
+            'task_id': task_id,
+            'state': state,
+            'status': progress_default if state == 'STARTED' else 'Временная ошибка, повторяем...',
+            'progress': 0
+        }
+    elif state == 'PROGRESS':
+        info = _as_dict(task_info)
+        response = {
+            'task_id': task_id,
+            'state': state,
+            'status': info.get('status', progress_default),
+            'progress': info.get('progress', 0)
+        }
+        if progress_extra:
+            response.update(progress_extra(info))
+    elif state == 'SUCCESS':
+        result = _as_dict(task_info)
+        response = {
+            'task_id': task_id,
+            'state': state,
+            'status': 'completed',
+            'progress': 100,
+            'message': result.get('message')
+        }
+        if success_extra:
+            response.update(success_extra(result))
+    else:  # FAILURE
+        error_info = _as_dict(task_info, for_error=True)
+        response = {
+            'task_id': task_id,
+            'state': state,
+            'status': 'error',
+            'error': error_info.get('error', 'Неизвестная ошибка'),
+            'exc_type': error_info.get('exc_type', 'Unknown')
+        }
+    
+    return response
+
+
+def _download_progress_extra(info: dict) -> dict:
+    return {
+        'title': info.get('title'),
+        'duration': info.get('duration')
+    }
+
+
+def _download_success_extra(result: dict) -> dict:
+    file_name = result.get('file_name')
+    return {
+        'file_name': file_name,
+        'file_size': result.get('file_size'),
+        'title': result.get('title'),
+        'duration': result.get('duration'),
+        'download_url': _FILE_URL_PREFIX + file_name if file_name else None
+    }
+
+
+def _render_download_status(task_id: str, state: str, task_info) -> dict:
+    """Формирует ответ о статусе задачи загрузки"""
+    return _render_task_status(task_id, state, task_info, 'Загружаем...',
+                               _download_progress_extra, _download_success_extra)
+
+
+@router.get("/status")
+async def get_download_status_batch(
+    ids: str = Query(..., description="task_id через запятую (не более 100)")
+):
+    """Получить статусы нескольких загрузок одним запросом к Redis"""
+    task_ids = [tid for tid in (part.strip() for part in ids.split(",")) if tid]
+    if not task_ids:
+        raise HTTPException(status_code=400, detail="Не указаны task_id")
+    if len(task_ids) > 100:
+        raise HTTPException(status_code=400, detail="Слишком много task_id (максимум 100)")
+    try:
+        statuses = await asyncio.to_thread(_fetch_task_statuses, task_ids)
+        return {
+            "results": {
+                task_id: _render_download_status(task_id, state, task_info)
+                for task_id, (state, task_info) in statuses.items()
+            }
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Ошибка получения статуса: {str(e)}")
+
+
 @router.get("/status/{task_id}")
-async def get_download_status(task_id: str):
+async def get_download_status(
+    task_id: str,
+    wait: float = Query(0, ge=0, le=60, description="Ждать изменения статуса до N секунд (long-poll)")
+):
     """Получить статус загрузки по task_id"""
     try:
-        task = download_video_task.AsyncResult(task_id)
-        
-        if task.state == 'PENDING':
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'status': 'Ожидание...',
-                'progress': 0
-            }
-        elif task.state == 'PROGRESS':
-            # Проверяем, что task.info является словарем
-            if isinstance(task.info, dict):
-                info = task.info
-            else:
-                info = {}
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'status': info.get('status', 'Загружаем...'),
-                'progress': info.get('progress', 0),
-                'title': info.get('title'),
-                'duration': info.get('duration')
-            }
-        elif task.state == 'SUCCESS':
-            # Проверяем, что task.result является словарем
-            if isinstance(task.result, dict):
-                result = task.result
-            else:
-                result = {}
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'status': 'completed',
-                'progress': 100,
-                'message': result.get('message'),
-                'file_name': result.get('file_name'),
-                'file_size': result.get('file_size'),
-                'title': result.get('title'),
-                'duration': result.get('duration'),
-                'download_url': f"/api/v1/download/file/{result.get('file_name')}" if result.get('file_name') else None
-            }
-        else:  # FAILURE
-            # Проверяем, что task.info является словарем
-            if isinstance(task.info, dict):
-                error_info = task.info
-            else:
-                # Если task.info это исключение, извлекаем информацию из него
-                error_info = {
-                    'error': str(task.info) if task.info else 'Неизвестная ошибка',
-                    'exc_type': type(task.info).__name__ if task.info else 'Unknown'
-                }
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'status': 'error',
-                'error': error_info.get('error', 'Неизвестная ошибка'),
-                'exc_type': error_info.get('exc_type', 'Unknown')
-            }
+        if wait:
+            state, task_info = await _wait_task_status(task_id, wait)
+        else:
+            # Запрос к Redis выполняем в потоке, чтобы не блокировать event loop
+            state, task_info = await asyncio.to_thread(_fetch_task_status, task_id)
         
-        return response
+        return _render_download_status(task_id, state, task_info)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Ошибка получения статуса: {str(e)}")
 
@@ -149,27 +400,17 @@ async def download_file(
         filename = filename.strip()
     if not filename:
         raise HTTPException(status_code=400, detail="Не указано имя файла")
-    video_path = _ASSETS_DIR / "video" / filename
-    srt_path = _ASSETS_DIR / "srt" / filename
-    nvoice_path = _ASSETS_DIR / "nvoice" / filename
-
-    if no_vocals:
-        # Только версия без голоса — не отдаём базовый mp3
-        file_path = nvoice_path if nvoice_path.exists() else None
-    else:
-        file_path = (
-            video_path if video_path.exists() else
-            srt_path if srt_path.exists() else
-            nvoice_path if nvoice_path.exists() else
-            None
-        )
+    # Отдаём только файлы непосредственно из папок assets (защита от path traversal)
+    _check_asset_name(filename)
+    
+    # Для no_vocals только версия без голоса — не отдаём базовый mp3
+    candidates = [dir_path / filename for dir_path in (_NO_VOCALS_FILE_DIRS if no_vocals else _FILE_DIRS)]
+    
+    # Один stat на кандидата: он же проверяет существование и даёт размер для FileResponse
+    file_path, stat_result = await asyncio.to_thread(_find_asset, candidates)
     
     if not file_path:
-        paths_checked = [
-            str(_ASSETS_DIR / "nvoice" / filename),
-            str(_ASSETS_DIR / "video" / filename),
-            str(_ASSETS_DIR / "srt" / filename),
-        ]
+        paths_checked = [str(path) for path in candidates]
         raise HTTPException(
             status_code=404,
             detail={
@@ -181,90 +422,150 @@ async def download_file(
             },
         )
     
-    return FileResponse(
+    return _AssetFileResponse(
         path=str(file_path),
         filename=filename,
-        media_type='application/octet-stream'
+        media_type='application/octet-stream',
+        stat_result=stat_result
     )
 
 
+def _iter_assets():
+    """Перебирает файлы из video, srt и nvoice по одному (блокирующий ввод-вывод, вызывать в потоке)"""
+    url_prefix = _FILE_URL_PREFIX
+    
+    def scan(dir_path: str, file_type, url_suffix: str = ""):
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    # is_file() берёт тип из getdents, stat() - единственный системный вызов на файл,
+                    # его результат DirEntry кэширует
+                    if entry.is_file():
+                        name = entry.name
+                        yield {
+                            "filename": name,
+                            "size": entry.stat().st_size,
+                            "type": file_type(name),
+                            "download_url": url_prefix + name + url_suffix
+                        }
+        except FileNotFoundError:
+            pass
+    
+    # Собираем файлы из папки video
+    yield from scan(_VIDEO_DIR_S, lambda name: "video" if not name.endswith('.mp3') else "audio")
+    # Собираем файлы из папки srt
+    yield from scan(_SRT_DIR_S, lambda name: "json" if name.endswith('.json') else "srt")
+    # Собираем файлы из папки nvoice (аудио без голоса)
+    yield from scan(_NVOICE_DIR_S, lambda name: "no_vocals", "?no_vocals=true")
+
+
+def _scan_assets() -> list:
+    """Собирает список файлов из video, srt и nvoice (блокирующий ввод-вывод, вызывать в потоке)"""
+    return list(_iter_assets())
+
+
+def _iter_assets_ndjson(batch_size: int = 1000):
+    """NDJSON по файлам assets пачками по batch_size строк. Генератор синхронный:
+    StreamingResponse вызывает его в пуле потоков, один переход в поток на пачку, а не на файл"""
+    lines = []
+    for entry in _iter_assets():
+        lines.append(orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE))
+        if len(lines) >= batch_size:
+            yield b"".join(lines)
+            lines.clear()
+    if lines:
+        yield b"".join(lines)
+
+
+# Кэш ответа /list: (mtime_ns папок video, srt, nvoice, время сборки) -> (готовый JSON, ETag).
+# mtime папки меняется при создании, удалении и переименовании файлов в ней, но не при дописывании:
+# ffmpeg и задачи пишут файлы на месте, поэтому размер недописанного файла обновится не позже чем через TTL
+_LIST_CACHE = None
+_LIST_CACHE_TTL = 5.0
+_LIST_CACHE_LOCK = asyncio.Lock()
+
+
+def _assets_mtimes() -> tuple:
+    """mtime_ns папок video, srt и nvoice (0 для отсутствующей папки)"""
+    mtimes = []
+    for dir_path in (_VIDEO_DIR_S, _SRT_DIR_S, _NVOICE_DIR_S):
+        try:
+            mtimes.append(os.stat(dir_path).st_mtime_ns)
+        except FileNotFoundError:
+            mtimes.append(0)
+    return tuple(mtimes)
+
+
+def _build_list_payload():
+    """Сканирует папки и сериализует ответ /list, возвращает (JSON, ETag)"""
+    files = _scan_assets()
+    payload = orjson.dumps({"files": files, "total": len(files)})
+    # ETag по содержимому: после force-пересканирования с теми же mtime клиент не получит устаревший 304
+    return payload, f'W/"{hashlib.md5(payload, usedforsecurity=False).hexdigest()}"'
+
+
 @router.get("/list")
-async def list_downloads():
+async def list_downloads(
+    request: Request,
+    force: bool = Query(False, description="Пересканировать папки без учёта кэша")
+):
     """Получить список загруженных файлов"""
+    global _LIST_CACHE
     try:
-        files = []
-        video_dir = _ASSETS_DIR / "video"
-        srt_dir = _ASSETS_DIR / "srt"
-        nvoice_dir = _ASSETS_DIR / "nvoice"
+        key = _assets_mtimes()
         
-        # Собираем файлы из папки video
-        if video_dir.exists():
-            for filename in os.listdir(video_dir):
-                file_path = video_dir / filename
-                if file_path.is_file():
-                    file_size = file_path.stat().st_size
-                    files.append({
-                        "filename": filename,
-                        "size": file_size,
-                        "type": "video" if not filename.endswith('.mp3') else "audio",
-                        "download_url": f"/api/v1/download/file/{filename}"
-                    })
+        def is_stale(entry) -> bool:
+            return (force or entry is None or entry[0] != key
+                    or time.monotonic() - entry[1] > _LIST_CACHE_TTL)
         
-        # Собираем файлы из папки srt
-        if srt_dir.exists():
-            for filename in os.listdir(srt_dir):
-                file_path = srt_dir / filename
-                if file_path.is_file():
-                    file_size = file_path.stat().st_size
-                    files.append({
-                        "filename": filename,
-                        "size": file_size,
-                        "type": "json" if filename.endswith('.json') else "srt",
-                        "download_url": f"/api/v1/download/file/{filename}"
-                    })
+        cached = _LIST_CACHE
+        if is_stale(cached):
+            async with _LIST_CACHE_LOCK:
+                cached = _LIST_CACHE
+                # Пока ждали блокировку, кэш мог обновить другой запрос
+                if is_stale(cached):
+                    # Сканирование папок выносим в поток, чтобы не блокировать event loop
+                    built_at = time.monotonic()
+                    cached = (key, built_at, *await asyncio.to_thread(_build_list_payload))
+                    _LIST_CACHE = cached
         
-        # Собираем файлы из папки nvoice (аудио без голоса)
-        if nvoice_dir.exists():
-            for filename in os.listdir(nvoice_dir):
-                file_path = nvoice_dir / filename
-                if file_path.is_file():
-                    file_size = file_path.stat().st_size
-                    files.append({
-                        "filename": filename,
-                        "size": file_size,
-                        "type": "no_vocals",
-                        "download_url": f"/api/v1/download/file/{filename}?no_vocals=true"
-                    })
-        
-        return {
-            "files": files,
-            "total": len(files)
-        }
+        _, _, payload, etag = cached
+        # no-cache: клиент может хранить ответ, но обязан перепроверять его через If-None-Match
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=payload, media_type="application/json", headers=headers)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Ошибка получения списка: {str(e)}")
 
 
+@router.get("/list/stream")
+async def list_downloads_stream():
+    """Список загруженных файлов в формате NDJSON (по строке на файл), без сборки всего списка в памяти"""
+    return StreamingResponse(_iter_assets_ndjson(), media_type="application/x-ndjson")
+
+
 @router.post("/srt", response_model=SRTResponse)
 async def create_srt(request: SRTRequest):
     """Создать JSON файл с субтитрами для видео с YouTube"""
     try:
         # Валидация размера модели
-        valid_models = ["tiny", "base", "small", "medium", "large"]
-        if request.model_size not in valid_models:
+        if request.model_size not in _VALID_MODEL_SIZES:
             raise HTTPException(
                 status_code=400,
-                detail=f"Неверный размер модели. Доступные: {', '.join(valid_models)}"
+                detail=f"Неверный размер модели. Доступные: {', '.join(_VALID_MODEL_SIZES)}"
             )
         
         # Запускаем задачу в фоне (она сама загрузит аудио и выполнит транскрипцию)
         task = create_srt_from_youtube_task.delay(
-            str(request.youtube_url),
+            request.youtube_url,
             model_size=request.model_size
         )
         
         return SRTResponse(
             task_id=task.id,
-            youtube_url=str(request.youtube_url),
+            youtube_url=request.youtube_url,
             status="pending",
             message="Задача создания JSON файла создана"
         )
@@ -274,78 +575,63 @@ async def create_srt(request: SRTRequest):
         raise HTTPException(status_code=400, detail=f"Ошибка создания задачи: {str(e)}")
 
 
+# task_id -> (имя JSON файла, mtime, размер) для завершённых задач SRT (LRU). Запись сверяется с mtime файла:
+# файл могли удалить или пересоздать повторной задачей
+_SRT_RESULT_CACHE = OrderedDict()
+_SRT_RESULT_CACHE_SIZE = 4096
+
+
+async def _srt_result_file(task_id: str, youtube_id: str):
+    """Возвращает (имя, размер) JSON файла результата или (None, None), если файла нет"""
+    cached = _SRT_RESULT_CACHE.get(task_id)
+    json_file = cached[0] if cached is not None else f"{youtube_id}.json"
+    try:
+        # stat выполняем в потоке, чтобы не блокировать event loop; сам кэш трогаем только из event loop
+        stat_result = await asyncio.to_thread(os.stat, os.path.join(_SRT_DIR_S, json_file))
+    except FileNotFoundError:
+        # Отсутствие файла не кэшируем: он может появиться позже
+        _SRT_RESULT_CACHE.pop(task_id, None)
+        return None, None
+    
+    if cached is not None and cached[1] == stat_result.st_mtime_ns:
+        _SRT_RESULT_CACHE.move_to_end(task_id)
+        return json_file, cached[2]
+    
+    _SRT_RESULT_CACHE[task_id] = (json_file, stat_result.st_mtime_ns, stat_result.st_size)
+    _SRT_RESULT_CACHE.move_to_end(task_id)
+    if len(_SRT_RESULT_CACHE) > _SRT_RESULT_CACHE_SIZE:
+        # Вытесняем запись, к которой дольше всего не обращались
+        _SRT_RESULT_CACHE.popitem(last=False)
+    return json_file, stat_result.st_size
+
+
 @router.get("/srt/status/{task_id}")
-async def get_srt_status(task_id: str):
+async def get_srt_status(
+    task_id: str,
+    wait: float = Query(0, ge=0, le=60, description="Ждать изменения статуса до N секунд (long-poll)")
+):
     """Получить статус создания JSON файла по task_id"""
     try:
-        task = create_srt_from_youtube_task.AsyncResult(task_id)
+        if wait:
+            state, task_info = await _wait_task_status(task_id, wait)
+        else:
+            # Запрос к Redis выполняем в потоке, чтобы не блокировать event loop
+            state, task_info = await asyncio.to_thread(_fetch_task_status, task_id)
         
-        if task.state == 'PENDING':
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'status': 'Ожидание...',
-                'progress': 0
-            }
-        elif task.state == 'PROGRESS':
-            # Проверяем, что task.info является словарем
-            if isinstance(task.info, dict):
-                info = task.info
-            else:
-                info = {}
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'status': info.get('status', 'Обрабатываем...'),
-                'progress': info.get('progress', 0)
-            }
-        elif task.state == 'SUCCESS':
-            # Проверяем, что task.result является словарем
-            if isinstance(task.result, dict):
-                result = task.result
-            else:
-                result = {}
-            
+        if state == 'SUCCESS':
             # Получаем YouTube ID из task_id или из результата
-            youtube_id = result.get('youtube_id', task_id)
-            json_file = f"{youtube_id}.json"
-            json_path = _ASSETS_DIR / "srt" / json_file
-            
-            # Если файл существует, добавляем информацию о нем
-            file_size = None
-            if json_path.exists():
-                file_size = json_path.stat().st_size
-            
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'status': 'completed',
-                'progress': 100,
-                'message': result.get('message'),
-                'file_name': json_file if json_path.exists() else None,
+            youtube_id = _as_dict(task_info).get('youtube_id', task_id)
+            json_file, file_size = await _srt_result_file(task_id, youtube_id)
+        
+        def success_extra(result: dict) -> dict:
+            return {
+                'file_name': json_file,
                 'file_size': file_size,
                 'segments_count': result.get('segments_count'),
-                'download_url': f"/api/v1/download/file/{json_file}" if json_path.exists() else None
-            }
-        else:  # FAILURE
-            # Проверяем, что task.info является словарем
-            if isinstance(task.info, dict):
-                error_info = task.info
-            else:
-                # Если task.info это исключение, извлекаем информацию из него
-                error_info = {
-                    'error': str(task.info) if task.info else 'Неизвестная ошибка',
-                    'exc_type': type(task.info).__name__ if task.info else 'Unknown'
-                }
-            response = {
-                'task_id': task_id,
-                'state': task.state,
-                'status': 'error',
-                'error': error_info.get('error', 'Неизвестная ошибка'),
-                'exc_type': error_info.get('exc_type', 'Unknown')
+                'download_url': _FILE_URL_PREFIX + json_file if json_file else None
             }
         
-        return response
+        return _render_task_status(task_id, state, task_info, 'Обрабатываем...', success_extra=success_extra)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Ошибка получения статуса: {str(e)}")
 
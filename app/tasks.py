@@ -1,50 +1,275 @@
 import os
 import subprocess
 import re
-import json
+import orjson
+import hashlib
+import random
+import asyncio
+import logging
+import threading
+import requests
+import torch
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
 from app.celery_app import celery_app
 from app.config import settings
+from app.proxy_manager import proxy_manager
 from app.rapidapi_service import RapidAPIService
 from app.whisperx_service import WhisperXService
 
 import warnings
 
+try:
+    import uvloop
+except ImportError:  # uvloop не поддерживает Windows - используем стандартный цикл asyncio
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
 # Глобальное отключение стандартных предупреждений
 warnings.filterwarnings("ignore", category=UserWarning)
 warnings.filterwarnings("ignore", category=FutureWarning)
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 
+# Повторы загрузки при временных сбоях сети/RapidAPI (429, 5xx, обрывы соединения)
+DOWNLOAD_MAX_RETRIES = 3
+DOWNLOAD_RETRY_BASE_DELAY = 1.0
+DOWNLOAD_RETRY_MAX_DELAY = 30
+DOWNLOAD_RETRY_JITTER = 0.5
+
+
+def is_transient_download_error(error: Exception) -> bool:
+    """Временная ли ошибка загрузки: имеет смысл повторить позже. Ошибки вроде отсутствия
+    видео или ffmpeg повтором не исправить"""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    # Обрыв соединения посреди тела ответа: requests отдаёт его как ChunkedEncodingError,
+    # а при чтении напрямую из urllib3 он приходит как ProtocolError/ReadTimeoutError
+    if isinstance(error, (requests.exceptions.ChunkedEncodingError, ProtocolError, ReadTimeoutError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in (429, 500, 502, 503, 504)
+    return False
+
+
+class NoSpeechError(Exception):
+    """WhisperX не нашёл речи в аудио (0 сегментов)"""
+
+
+_ASSETS_DIR = "assets"
+_VIDEO_DIR = os.path.join(_ASSETS_DIR, "video")
+_SRT_DIR = os.path.join(_ASSETS_DIR, "srt")
+_NVOICE_DIR = os.path.join(_ASSETS_DIR, "nvoice")
+
+
 def ensure_directories():
     """Создает необходимые директории если их нет"""
-    assets_dir = "assets"
-    video_dir = os.path.join(assets_dir, "video")
-    srt_dir = os.path.join(assets_dir, "srt")
-    nvoice_dir = os.path.join(assets_dir, "nvoice")
-    
-    os.makedirs(video_dir, exist_ok=True)
-    os.makedirs(srt_dir, exist_ok=True)
-    os.makedirs(nvoice_dir, exist_ok=True)
+    os.makedirs(_VIDEO_DIR, exist_ok=True)
+    os.makedirs(_SRT_DIR, exist_ok=True)
+    os.makedirs(_NVOICE_DIR, exist_ok=True)
     
-    return video_dir, srt_dir, nvoice_dir
+    return _VIDEO_DIR, _SRT_DIR, _NVOICE_DIR
+
+
+# ffmpeg найден и запускается; бинарник не меняется за время жизни воркера, поэтому проверяем один раз
+_ffmpeg_checked = False
+
+
+def check_ffmpeg() -> bool:
+    """Проверяет, что ffmpeg доступен. Успешный результат запоминается на процесс, неуспешный - нет,
+    чтобы воркер увидел ffmpeg, установленный после его запуска"""
+    global _ffmpeg_checked
+    if not _ffmpeg_checked:
+        try:
+            subprocess.run(['ffmpeg', '-version'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, timeout=10)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
+            return False
+        _ffmpeg_checked = True
+    return True
+
+
+@worker_init.connect
+def probe_ffmpeg(**kwargs):
+    """Проверяет ffmpeg один раз в главном процессе воркера: результат наследуют дочерние процессы prefork"""
+    if not check_ffmpeg():
+        logger.error("FFmpeg не найден: задачи загрузки и обработки аудио будут завершаться с ошибкой")
+
+
+# Все поддерживаемые формы ссылок в одном выражении: URL просматривается один раз
+_YT_ID_RE = re.compile(r'(?:youtube\.com/(?:watch\?v=|embed/|v/|shorts/)|youtu\.be/)([a-zA-Z0-9_-]{11})')
+
+
+# Один сервис RapidAPI на процесс воркера: его HTTP сессия держит keep-alive соединения
+# к RapidAPI и CDN между задачами, и следующая загрузка не тратит время на TCP/TLS рукопожатие
+_rapidapi_service = None
+
+
+def get_rapidapi_service() -> RapidAPIService:
+    global _rapidapi_service
+    if _rapidapi_service is None:
+        _rapidapi_service = RapidAPIService()
+    return _rapidapi_service
+
+
+@worker_process_shutdown.connect
+def close_rapidapi_service(**kwargs):
+    """Закрывает сессию RapidAPI при остановке процесса воркера"""
+    if _rapidapi_service is not None:
+        _rapidapi_service.close()
+
+
+# Очереди, задачи которых выполняют инференс torch (WhisperX, Demucs)
+_TORCH_QUEUES = {'transcription', 'no_vocals'}
+
+
+@worker_process_init.connect
+def configure_torch(**kwargs):
+    """Настраивает torch в процессе воркера: только инференс, без переподписки CPU потоками"""
+    torch.set_grad_enabled(False)
+    # При явно заданной конкурентности делим ядра между процессами prefork. Только на воркерах, которые
+    # потребляют исключительно очереди torch (transcription/no_vocals): на остальных torch не считает,
+    # а ограничение потоков задело бы общий воркер без -Q
+    consume_from = set(celery_app.amqp.queues.consume_from or {})
+    if settings.celery_worker_concurrency and consume_from and consume_from <= _TORCH_QUEUES:
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // settings.celery_worker_concurrency))
+
+
+def _preload_whisperx_model():
+    try:
+        logger.info("Предзагрузка модели WhisperX: %s", settings.whisperx_model)
+        WhisperXService().warmup()
+    except Exception:
+        logger.exception("Не удалось предзагрузить модель WhisperX, она загрузится в первой задаче")
+
+
+@worker_process_init.connect
+def preload_whisperx_model(**kwargs):
+    """Загружает и прогревает модель WhisperX при старте процесса воркера транскрипции"""
+    if not settings.whisperx_preload:
+        return
+    # Без -Q consume_from содержит все объявленные очереди, поэтому предзагружаем только
+    # на выделенном воркере транскрипции (-Q transcription), а не на общем dev-воркере
+    consume_from = celery_app.amqp.queues.consume_from or {}
+    if set(consume_from) != {'transcription'}:
+        return
+    # Загрузка модели занимает дольше worker_proc_alive_timeout (4 с), поэтому не блокируем
+    # инициализацию процесса: грузим в фоне, а первая задача дождётся её на блокировке кэша моделей
+    threading.Thread(target=_preload_whisperx_model, name="whisperx-preload", daemon=True).start()
 
 
 def extract_youtube_id(url: str) -> str:
     """Извлекаем YouTube ID из URL"""
-    patterns = [
-        r'(?:youtube\.com/watch\?v=|youtu\.be/|youtube\.com/embed/)([a-zA-Z0-9_-]{11})',
-        r'youtube\.com/v/([a-zA-Z0-9_-]{11})',
-        r'youtube\.com/shorts/([a-zA-Z0-9_-]{11})'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
+    match = _YT_ID_RE.search(url)
+    if match:
+        return match.group(1)
     
     # Если не удалось извлечь ID, используем хеш от URL
-    import hashlib
-    return hashlib.md5(url.encode()).hexdigest()[:11]
+    return hashlib.blake2b(url.encode(), digest_size=8).hexdigest()[:11]
+
+
+def _stat_or_none(path: str):
+    """Один stat вместо пары exists + getsize; None, если файла нет"""
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _update_progress(task, status: str, progress: int):
+    """Обновляет прогресс Celery-задачи; без задачи (прямой вызов) ничего не делает"""
+    if task is not None:
+        task.update_state(state='PROGRESS', meta={'status': status, 'progress': progress})
+
+
+def _download_audio_sync(youtube_url: str, task=None, *, youtube_id: str = None, video_dir: str = None) -> dict:
+    """
+    Загружает аудио с YouTube через RapidAPI в текущем процессе
+    
+    Args:
+        youtube_url: URL видео на YouTube
+        task: Celery-задача для обновления прогресса (None при прямом вызове)
+        youtube_id: Уже извлечённый YouTube ID (не извлекаем повторно)
+        video_dir: Уже созданная папка для аудио (не вызываем ensure_directories)
+        
+    Returns:
+        dict: Результат загрузки (как у download_video_task). Исключения пробрасываются вызывающему
+    """
+    # Проверяем FFmpeg для аудио конвертации
+    if not check_ffmpeg():
+        return {
+            'status': 'failed',
+            'error': 'FFmpeg не найден. Установите FFmpeg для конвертации аудио в MP3.',
+            'exc_type': 'FFmpegNotFound'
+        }
+    
+    # Обновляем статус задачи
+    _update_progress(task, 'Начинаем загрузку через RapidAPI...', 0)
+    
+    # Убеждаемся, что папки существуют
+    if video_dir is None:
+        video_dir, _, _ = ensure_directories()
+    
+    # Извлекаем YouTube ID для имени файла
+    if youtube_id is None:
+        youtube_id = extract_youtube_id(youtube_url)
+    logger.info("YouTube ID: %s", youtube_id)
+    
+    # Проверяем, есть ли файл уже локально
+    mp3_file = f"{youtube_id}.mp3"
+    mp3_path = os.path.join(video_dir, mp3_file)
+    
+    st = _stat_or_none(mp3_path)
+    if st is not None:
+        file_size = st.st_size
+        logger.info("Файл уже существует локально: %s", mp3_file)
+        create_no_vocals_task.delay(mp3_path)
+        return {
+            'status': 'completed',
+            'progress': 100,
+            'message': 'Аудио найдено локально (пропущена загрузка)',
+            'file_path': mp3_path,
+            'file_name': mp3_file,
+            'file_size': file_size,
+            'download_type': 'аудио',
+            'youtube_id': youtube_id,
+            'cached': True
+        }
+    
+    # Инициализируем RapidAPI сервис
+    _update_progress(task, 'Подключаемся к RapidAPI...', 10)
+    rapidapi = get_rapidapi_service()
+    # Скачиваем аудио через RapidAPI
+    _update_progress(task, 'Скачиваем аудио через RapidAPI...', 20)
+    logger.info("Начинаем загрузку аудио через RapidAPI для %s", youtube_url)
+    
+    downloaded_path = rapidapi.download_youtube_audio(
+        url=youtube_url,
+        output_path=mp3_path
+    )
+    
+    # Один stat и проверяет наличие файла, и даёт его размер
+    st = _stat_or_none(downloaded_path)
+    if st is None:
+        raise Exception(f"Файл не был создан после загрузки: {downloaded_path}")
+    file_size = st.st_size
+    
+    logger.info("✅ Аудио успешно загружено: %s (%.2f МБ)", mp3_file, file_size / 1024 / 1024)
+    
+    _update_progress(task, 'Загрузка завершена', 100)
+    create_no_vocals_task.delay(downloaded_path)
+    return {
+        'status': 'completed',
+        'progress': 100,
+        'message': 'Аудио успешно загружено через RapidAPI',
+        'file_path': downloaded_path,
+        'file_name': mp3_file,
+        'file_size': file_size,
+        'download_type': 'аудио',
+        'youtube_id': youtube_id,
+        'cached': False
+    }
 
 
 @celery_app.task(bind=True)
@@ -61,85 +286,21 @@ def download_video_task(self, youtube_url: str, audio_only: bool = False):
                 'exc_type': 'UnsupportedOperation'
             }
         
-        # Проверяем FFmpeg для аудио конвертации
-        try:
-            subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return {
-                'status': 'failed',
-                'error': 'FFmpeg не найден. Установите FFmpeg для конвертации аудио в MP3.',
-                'exc_type': 'FFmpegNotFound'
-            }
-        
-        # Обновляем статус задачи
-        self.update_state(state='PROGRESS', meta={'status': 'Начинаем загрузку через RapidAPI...', 'progress': 0})
-        
-        # Убеждаемся, что папки существуют
-        video_dir, srt_dir, _ = ensure_directories()
-        
-        # Извлекаем YouTube ID для имени файла
-        youtube_id = extract_youtube_id(youtube_url)
-        print(f"YouTube ID: {youtube_id}")
-        
-        # Проверяем, есть ли файл уже локально
-        mp3_file = f"{youtube_id}.mp3"
-        mp3_path = os.path.join(video_dir, mp3_file)
-        
-        if os.path.exists(mp3_path):
-            file_size = os.path.getsize(mp3_path)
-            print(f"Файл уже существует локально: {mp3_file}")
-            create_no_vocals_task.delay(mp3_path)
-            return {
-                'status': 'completed',
-                'progress': 100,
-                'message': 'Аудио найдено локально (пропущена загрузка)',
-                'file_path': mp3_path,
-                'file_name': mp3_file,
-                'file_size': file_size,
-                'download_type': 'аудио',
-                'youtube_id': youtube_id,
-                'cached': True
-            }
-        
-        # Инициализируем RapidAPI сервис
-        self.update_state(state='PROGRESS', meta={'status': 'Подключаемся к RapidAPI...', 'progress': 10})
-        rapidapi = RapidAPIService()
-        
-        # Скачиваем аудио через RapidAPI
-        self.update_state(state='PROGRESS', meta={'status': 'Скачиваем аудио через RapidAPI...', 'progress': 20})
-        print(f"Начинаем загрузку аудио через RapidAPI для {youtube_url}")
-        
-        downloaded_path = rapidapi.download_youtube_audio(
-            url=youtube_url,
-            output_path=mp3_path
-        )
-        
-        if not os.path.exists(downloaded_path):
-            raise Exception(f"Файл не был создан после загрузки: {downloaded_path}")
-        
-        file_size = os.path.getsize(downloaded_path)
-        print(f"✅ Аудио успешно загружено: {mp3_file} ({file_size / 1024 / 1024:.2f} МБ)")
-        
-        self.update_state(
-            state='PROGRESS',
-            meta={'status': 'Загрузка завершена', 'progress': 100}
-        )
-        create_no_vocals_task.delay(downloaded_path)
-        return {
-            'status': 'completed',
-            'progress': 100,
-            'message': 'Аудио успешно загружено через RapidAPI',
-            'file_path': downloaded_path,
-            'file_name': mp3_file,
-            'file_size': file_size,
-            'download_type': 'аудио',
-            'youtube_id': youtube_id,
-            'cached': False
-        }
+        return _download_audio_sync(youtube_url, self)
                 
     except Exception as e:
         error_message = str(e)
-        print(f"Ошибка загрузки через RapidAPI: {error_message}")
+        logger.error("Ошибка загрузки через RapidAPI: %s", error_message)
+        
+        # Временные сбои повторяем с экспоненциальной задержкой и джиттером, остальные сразу считаем ошибкой
+        if is_transient_download_error(e) and self.request.retries < DOWNLOAD_MAX_RETRIES:
+            countdown = min(
+                DOWNLOAD_RETRY_MAX_DELAY,
+                DOWNLOAD_RETRY_BASE_DELAY * 2 ** self.request.retries * (1 + random.uniform(0, DOWNLOAD_RETRY_JITTER))
+            )
+            logger.warning("Повтор загрузки через %.1fs (попытка %s/%s)", countdown, self.request.retries + 1, DOWNLOAD_MAX_RETRIES)
+            raise self.retry(exc=e, countdown=countdown, max_retries=DOWNLOAD_MAX_RETRIES)
+        
         self.update_state(
             state='FAILURE',
             meta={
@@ -163,6 +324,7 @@ def create_no_vocals_task(self, mp3_path: str):
     """
     import tempfile
     import shutil
+    import demucs.separate
     try:
         if not os.path.exists(mp3_path):
             raise FileNotFoundError(f"Аудио файл не найден: {mp3_path}")
@@ -185,14 +347,22 @@ def create_no_vocals_task(self, mp3_path: str):
         self.update_state(state='PROGRESS', meta={'status': 'Запуск Demucs...', 'progress': 10})
 
         with tempfile.TemporaryDirectory(prefix="demucs_") as tmp_dir:
-            # demucs --two-stems=vocals создаёт no_vocals.wav и vocals.wav
-            cmd = [
-                "demucs", "--two-stems=vocals", "-o", tmp_dir, mp3_path
-            ]
+            # demucs --two-stems=vocals создаёт no_vocals.wav и vocals.wav.
+            # Вызываем в процессе воркера, а не через CLI: без запуска нового интерпретатора и импорта torch.
+            # Время ограничено soft_time_limit задачи: Celery прерывает demucs исключением SoftTimeLimitExceeded
             self.update_state(state='PROGRESS', meta={'status': 'Разделение источников (Demucs)...', 'progress': 20})
-            proc = subprocess.run(cmd, capture_output=True, text=True, timeout=3600)
-            if proc.returncode != 0:
-                raise RuntimeError(f"Demucs ошибка: {proc.stderr or proc.stdout}")
+            try:
+                demucs.separate.main(["--two-stems=vocals", "-o", tmp_dir, mp3_path])
+            except SystemExit as e:
+                # CLI demucs сообщает об ошибках через sys.exit
+                if e.code:
+                    raise RuntimeError(f"Demucs ошибка: код выхода {e.code}")
+            except SoftTimeLimitExceeded:
+                raise RuntimeError(f"Demucs не уложился в лимит времени ({self.soft_time_limit} с)")
+            finally:
+                # Модель и тензоры demucs остаются в кэше CUDA воркера - возвращаем память другим задачам
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
 
             # Структура: tmp_dir/htdemucs/<base_name>/no_vocals.wav
             model_subdir = "htdemucs"
@@ -200,13 +370,14 @@ def create_no_vocals_task(self, mp3_path: str):
             no_vocals_wav = os.path.join(tmp_dir, model_subdir, track_subdir, "no_vocals.wav")
             if not os.path.exists(no_vocals_wav):
                 # попробовать другие имена (например, с суффиксом из-за точки в имени)
-                for d in os.listdir(os.path.join(tmp_dir, model_subdir)):
-                    candidate = os.path.join(tmp_dir, model_subdir, d, "no_vocals.wav")
-                    if os.path.exists(candidate):
-                        no_vocals_wav = candidate
-                        break
-                else:
-                    raise FileNotFoundError(f"Demucs не создал no_vocals.wav в {tmp_dir}")
+                with os.scandir(os.path.join(tmp_dir, model_subdir)) as it:
+                    for entry in it:
+                        candidate = os.path.join(entry.path, "no_vocals.wav")
+                        if entry.is_dir() and os.path.exists(candidate):
+                            no_vocals_wav = candidate
+                            break
+                    else:
+                        raise FileNotFoundError(f"Demucs не создал no_vocals.wav в {tmp_dir}")
 
             self.update_state(state='PROGRESS', meta={'status': 'Конвертация в MP3...', 'progress': 90})
             # Конвертируем WAV в MP3 в nvoice
@@ -226,13 +397,13 @@ def create_no_vocals_task(self, mp3_path: str):
         }
     except Exception as e:
         error_message = str(e)
-        print(f"Ошибка create_no_vocals: {error_message}")
+        logger.error("Ошибка create_no_vocals: %s", error_message)
         self.update_state(state='FAILURE', meta={'status': 'Ошибка', 'error': error_message, 'exc_type': type(e).__name__})
         return {'status': 'failed', 'error': error_message, 'exc_type': type(e).__name__}
 
 
 @celery_app.task(bind=True)
-def transcribe_audio_task(self, audio_path: str, task_id: str = None, model_size: str = None):
+def transcribe_audio_task(self, audio_path: str, task_id: str = None, model_size: str = None, beam_size: int = None):
     """
     Задача для транскрипции аудио с использованием WhisperXService
     
@@ -240,14 +411,15 @@ def transcribe_audio_task(self, audio_path: str, task_id: str = None, model_size
         audio_path: Путь к аудио файлу для транскрипции
         task_id: Идентификатор задачи (опционально)
         model_size: Размер модели WhisperX (tiny, base, small, medium, large). По умолчанию из config
+        beam_size: Ширина beam search (больше - точнее, но медленнее). По умолчанию из config
         
     Returns:
         dict: Результат транскрипции с сегментами
     """
     try:
-        print(f"🎤 Начинаем транскрипцию аудио: {audio_path}")
+        logger.info("🎤 Начинаем транскрипцию аудио: %s", audio_path)
         if task_id:
-            print(f"  Task ID: {task_id}")
+            logger.info("  Task ID: %s", task_id)
         
         # Обновляем статус задачи
         self.update_state(
@@ -275,13 +447,13 @@ def transcribe_audio_task(self, audio_path: str, task_id: str = None, model_size
         
         if os.path.exists(audio_mp3_path) and audio_mp3_path != audio_path:
             audio_path = audio_mp3_path
-            print(f"📁 Используем MP3 файл для транскрипции: {audio_path}")
+            logger.info("📁 Используем MP3 файл для транскрипции: %s", audio_path)
             # Обновляем original_mp3_path, если нашли MP3
             if not original_mp3_path:
                 original_mp3_path = audio_mp3_path
         elif os.path.exists(audio_wav_path) and audio_wav_path != audio_path:
             audio_path = audio_wav_path
-            print(f"📁 Используем WAV файл для транскрипции: {audio_path}")
+            logger.info("📁 Используем WAV файл для транскрипции: %s", audio_path)
         
         # Обновляем статус
         self.update_state(
@@ -290,7 +462,7 @@ def transcribe_audio_task(self, audio_path: str, task_id: str = None, model_size
         )
         
         # Создаём сервис транскрипции и выполняем транскрипцию
-        transcription_service = WhisperXService(model_size=model_size)
+        transcription_service = WhisperXService(model_size=model_size, beam_size=beam_size)
         
         self.update_state(
             state='PROGRESS',
@@ -308,8 +480,8 @@ def transcribe_audio_task(self, audio_path: str, task_id: str = None, model_size
         # Если сегментов нет - это ошибка
         if not segments or len(segments) == 0:
             error_msg = f"WhisperX не смог распознать речь в аудио файле (0 сегментов). Возможные причины: тихий звук, фоновый шум, поврежденный файл"
-            print(f"❌ {error_msg}")
-            raise Exception(error_msg)
+            logger.error("❌ %s", error_msg)
+            raise NoSpeechError(error_msg)
         
         # Если указан task_id, сохраняем результат в JSON файл
         if task_id:
@@ -318,19 +490,13 @@ def transcribe_audio_task(self, audio_path: str, task_id: str = None, model_size
             json_file = f"{task_id}.json"
             json_path = os.path.join(srt_dir, json_file)
             
-            # Формируем JSON данные из сегментов
-            json_data = []
-            for segment in segments:
-                json_data.append({
-                    'start': segment.get('start', 0),
-                    'end': segment.get('end', 0),
-                    'text': segment.get('text', '').strip()
-                })
+            # Сегменты из WhisperXService.process_segments уже имеют вид {start, end, text} с очищенным
+            # текстом, поэтому сериализуем их напрямую без промежуточной копии списка.
+            # orjson сразу пишет UTF-8 байты; OPT_SERIALIZE_NUMPY - на случай numpy-чисел во временных метках
+            with open(json_path, 'wb') as f:
+                f.write(orjson.dumps(segments, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
             
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(json_data, f, ensure_ascii=False, indent=4)
-            
-            print(f"✅ Результат сохранен в: {json_path}")
+            logger.info("✅ Результат сохранен в: %s", json_path)
         
         # Обновляем статус
         self.update_state(
@@ -349,15 +515,15 @@ def transcribe_audio_task(self, audio_path: str, task_id: str = None, model_size
             'youtube_id': task_id if task_id else None
         }
         
-        print(f"✅ Транскрипция завершена: {len(segments)} сегментов")
+        logger.info("✅ Транскрипция завершена: %s сегментов", len(segments))
         return result
         
     except Exception as e:
         error_message = str(e)
-        print(f"❌ Ошибка транскрипции: {error_message}")
+        logger.error("❌ Ошибка транскрипции: %s", error_message)
         
         # Если ошибка связана с 0 сегментами, удаляем исходный MP3 файл
-        if "0 сегментов" in error_message or "не смог распознать речь" in error_message:
+        if isinstance(e, NoSpeechError):
             # Пытаемся найти и удалить исходный MP3 файл
             mp3_to_delete = None
             
@@ -386,9 +552,9 @@ def transcribe_audio_task(self, audio_path: str, task_id: str = None, model_size
             if mp3_to_delete:
                 try:
                     os.remove(mp3_to_delete)
-                    print(f"🗑️ Удален исходный MP3 файл: {mp3_to_delete}")
+                    logger.info("🗑️ Удален исходный MP3 файл: %s", mp3_to_delete)
                 except Exception as delete_error:
-                    print(f"⚠️ Не удалось удалить MP3 файл {mp3_to_delete}: {delete_error}")
+                    logger.warning("⚠️ Не удалось удалить MP3 файл %s: %s", mp3_to_delete, delete_error)
         
         # Обновляем статус задачи с ошибкой перед пробросом исключения
         self.update_state(
@@ -416,36 +582,35 @@ def create_srt_from_youtube_task(self, youtube_url: str, model_size: str = "medi
         model_size: Размер модели WhisperX (tiny, base, small, medium, large)
     """
     try:
-        # Убеждаемся, что папки существуют
-        video_dir, srt_dir, _ = ensure_directories()
-        
         # Извлекаем YouTube ID
         youtube_id = extract_youtube_id(youtube_url)
-        print(f"Создание JSON субтитров для YouTube ID: {youtube_id}")
+        logger.info("Создание JSON субтитров для YouTube ID: %s", youtube_id)
         
-        # Проверяем, существует ли уже JSON файл
+        # Проверяем, существует ли уже JSON файл (до создания папок: на готовом результате они не нужны)
         json_file = f"{youtube_id}.json"
-        json_path = os.path.join(srt_dir, json_file)
+        json_path = os.path.join(_SRT_DIR, json_file)
         
-        if os.path.exists(json_path):
+        st = _stat_or_none(json_path)
+        if st is not None:
             self.update_state(
                 state='PROGRESS',
                 meta={'status': 'JSON файл уже существует', 'progress': 100}
             )
             
-            file_size = os.path.getsize(json_path)
-            
             return {
                 'status': 'completed',
                 'progress': 100,
                 'message': 'JSON файл уже существует',
                 'file_path': json_path,
                 'file_name': json_file,
-                'file_size': file_size,
+                'file_size': st.st_size,
                 'youtube_id': youtube_id,
                 'cached': True
             }
         
+        # Убеждаемся, что папки существуют
+        video_dir, srt_dir, _ = ensure_directories()
+        
         # Проверяем наличие аудио файла
         audio_file = f"{youtube_id}.mp3"
         audio_path = os.path.join(video_dir, audio_file)
@@ -458,25 +623,16 @@ def create_srt_from_youtube_task(self, youtube_url: str, model_size: str = "medi
                 meta={'status': 'Аудио не найдено. Загружаем аудио...', 'progress': 10}
             )
             
-            print(f"Аудио файл не найден. Загружаем аудио для {youtube_url}")
+            logger.info("Аудио файл не найден. Загружаем аудио для %s", youtube_url)
             
-            # Запускаем задачу загрузки аудио синхронно (внутри задачи)
-            download_result = download_video_task.apply(args=[youtube_url, True])
+            # Загружаем аудио прямо в этом процессе, без Celery-обвязки apply()
+            result = _download_audio_sync(youtube_url, youtube_id=youtube_id, video_dir=video_dir)
+            if result['status'] == 'failed':
+                raise Exception(f"Ошибка загрузки аудио: {result.get('error', 'Неизвестная ошибка')}")
             
-            if download_result.successful():
-                result = download_result.result
-                if isinstance(result, dict) and result.get('status') == 'failed':
-                    raise Exception(f"Ошибка загрузки аудио: {result.get('error', 'Неизвестная ошибка')}")
-            else:
-                raise Exception(f"Ошибка загрузки аудио: {str(download_result.info)}")
-            
-            # Проверяем, что файл появился
-            if not os.path.exists(audio_path):
-                raise Exception("Аудио файл не был создан после загрузки")
-            
-            print(f"Аудио успешно загружено: {audio_file}")
+            logger.info("Аудио успешно загружено: %s", audio_file)
         else:
-            print(f"Используем существующий аудио файл: {audio_file}")
+            logger.info("Используем существующий аудио файл: %s", audio_file)
         
         # Запускаем транскрипцию
         self.update_state(
@@ -494,12 +650,11 @@ def create_srt_from_youtube_task(self, youtube_url: str, model_size: str = "medi
             if isinstance(result, dict) and result.get('status') == 'failed':
                 raise Exception(f"Ошибка транскрипции: {result.get('error', 'Неизвестная ошибка')}")
             
-            # Проверяем, что JSON файл создан
-            if not os.path.exists(json_path):
+            # Проверяем, что JSON файл создан (один stat вместо exists + getsize)
+            st = _stat_or_none(json_path)
+            if st is None:
                 raise Exception("JSON файл не был создан после транскрипции")
             
-            file_size = os.path.getsize(json_path)
-            
             self.update_state(
                 state='PROGRESS',
                 meta={'status': 'JSON файл создан успешно', 'progress': 100}
@@ -511,7 +666,7 @@ def create_srt_from_youtube_task(self, youtube_url: str, model_size: str = "medi
                 'message': 'JSON файл успешно создан',
                 'file_path': json_path,
                 'file_name': json_file,
-                'file_size': file_size,
+                'file_size': st.st_size,
                 'youtube_id': youtube_id,
                 'cached': False,
                 'audio_cached': audio_exists
@@ -531,7 +686,7 @@ def create_srt_from_youtube_task(self, youtube_url: str, model_size: str = "medi
         
     except Exception as e:
         error_message = str(e)
-        print(f"Ошибка создания JSON: {error_message}")
+        logger.error("Ошибка создания JSON: %s", error_message)
         
         self.update_state(
             state='FAILURE',
@@ -547,3 +702,17 @@ def create_srt_from_youtube_task(self, youtube_url: str, model_size: str = "medi
             'error': error_message,
             'exc_type': type(e).__name__
         }
+
+
+@celery_app.task(name="app.tasks.refresh_proxies")
+def refresh_proxies_task():
+    """
+    Задача для обновления списка рабочих прокси.
+    Ставится в очередь proxy_refresh из ProxyManager.request_refresh
+    """
+    # Проверка прокси - чисто сетевой fan-out, на цикле uvloop (libuv) он заметно быстрее
+    if uvloop is not None:
+        uvloop.run(proxy_manager.update_working_proxies())
+    else:
+        asyncio.run(proxy_manager.update_working_proxies())
+    return {'status': 'completed', 'proxies_count': len(proxy_manager.working_proxies)}
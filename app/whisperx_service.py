@@ -3,10 +3,13 @@
 """
 
 import os
+import gc
+import dataclasses
 import json
-import tempfile
-import subprocess
+import threading
+from collections import OrderedDict
 from pathlib import Path
+import numpy as np
 from app.config import settings
 
 # Импортируем torch ДО whisperx, чтобы можно было его патчить
@@ -47,6 +50,7 @@ torch.serialization.load = _patched_torch_load
 
 # Теперь импортируем whisperx после патчинга torch.load
 import whisperx
+from whisperx.audio import SAMPLE_RATE
 
 import warnings
 
@@ -66,21 +70,27 @@ warnings.filterwarnings("ignore", module="transformers")
 class WhisperXService:
     """Сервис для работы с WhisperX через API методы"""
 
-    # Глобальный кэш для моделей whisperx
-    _models_cache = {}
+    # Глобальный кэш для моделей whisperx (LRU: не больше settings.whisperx_max_models моделей в памяти)
+    _models_cache = OrderedDict()
+    _models_lock = threading.Lock()
+    # Модель общая для потоков процесса (фоновая предзагрузка и задача): подмена options и транскрипция под одной блокировкой
+    _inference_lock = threading.Lock()
     _align_models_cache = {}
 
-    def __init__(self, model_size: str = None, device: str = None):
+    def __init__(self, model_size: str = None, device: str = None, beam_size: int = None):
         """
         Инициализация сервиса WhisperX
         
         Args:
             model_size: Размер модели (tiny, base, small, medium, large). По умолчанию из config
             device: Устройство (cuda или cpu). По умолчанию определяется автоматически
+            beam_size: Ширина beam search. По умолчанию из config (1 - жадный поиск)
         """
         self.model_size = model_size or settings.whisperx_model
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        self.compute_type = "float16" if self.device == "cuda" else "int8"
+        # На GPU: int8-веса + fp16-активации — вдвое меньше VRAM и INT8 Tensor Cores
+        self.compute_type = "int8_float16" if self.device == "cuda" else "int8"
+        self.beam_size = beam_size or settings.whisperx_beam_size
         
         # Загружаем модель при инициализации
         self.model = self._load_model()
@@ -88,7 +98,7 @@ class WhisperXService:
         if self.device == "cuda":
             print(f"Используем GPU: {torch.cuda.get_device_name(0)}")
             print(f"CUDA версия: {torch.version.cuda}")
-            print(f"Compute type: {self.compute_type} (FP16)")
+            print(f"Compute type: {self.compute_type} (INT8 + FP16)")
             torch.backends.cudnn.benchmark = True
         else:
             print("GPU не доступен, используем CPU")
@@ -96,22 +106,55 @@ class WhisperXService:
 
     def _load_model(self):
         """Загружает модель WhisperX с кэшированием"""
+        # beam_size в ключ не входит: он подставляется на время вызова в _transcribe_with_beam
         cache_key = f"{self.model_size}_{self.device}_{self.compute_type}"
         
-        if cache_key not in self._models_cache:
+        with self._models_lock:
+            if cache_key in self._models_cache:
+                print(f"✅ Используем закэшированную модель whisperx: {self.model_size} на {self.device}")
+                self._models_cache.move_to_end(cache_key)
+                return self._models_cache[cache_key]
+
+            # Выгружаем давно не использованные модели до загрузки новой, иначе VRAM может не хватить
+            while len(self._models_cache) >= max(settings.whisperx_max_models, 1):
+                evicted_key, evicted_model = self._models_cache.popitem(last=False)
+                print(f"🗑️ Выгружаем модель whisperx из кэша: {evicted_key}")
+                del evicted_model
+                gc.collect()
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+
             print(f"Загружаем модель whisperx: {self.model_size} на устройстве: {self.device}")
             model = whisperx.load_model(
                 self.model_size,
                 device=self.device,
-                compute_type=self.compute_type
+                compute_type=self.compute_type,
+                # Веса в CTranslate2-формате кэшируются на диске (WHISPERX_MODELS_DIR или кэш HuggingFace):
+                # перезапуск воркера читает их с диска
+                download_root=settings.whisperx_models_dir,
+                local_files_only=settings.whisperx_local_files_only,
+                # Параметры декодирования задаются при загрузке модели; без fallback по температуре
+                # и без условия на предыдущий текст - меньше повторных проходов декодера
+                asr_options={
+                    "beam_size": settings.whisperx_beam_size,
+                    "best_of": 1,
+                    "temperatures": [0.0],
+                    "condition_on_previous_text": False,
+                }
             )
             self._models_cache[cache_key] = model
             print(f"✅ Модель whisperx загружена и закэширована")
-        else:
-            print(f"✅ Используем закэшированную модель whisperx: {self.model_size} на {self.device}")
-            model = self._models_cache[cache_key]
-        
-        return model
+            return model
+
+    @torch.inference_mode()
+    def warmup(self):
+        """Прогоняет секунду тишины, чтобы создать CUDA-контекст и подобрать ядра до первой задачи"""
+        try:
+            with self._inference_lock:
+                self.model.transcribe(np.zeros(16000, dtype=np.float32), batch_size=1)
+        except Exception as e:
+            # На тишине VAD может не найти сегментов - для прогрева это не важно
+            print(f"⚠️ Прогрев модели whisperx завершился с ошибкой: {e}")
 
     def _load_align_model(self, language_code: str):
         """Загружает модель выравнивания с кэшированием"""
@@ -179,54 +222,21 @@ class WhisperXService:
         """Транскрибирует большой аудиофайл по частям"""
         print(f"🎤 Транскрибируем большой файл по частям: {audio_path}")
 
-        # Получаем информацию об аудио
-        try:
-            from pydub import AudioSegment
-        except ImportError:
-            raise ImportError("pydub не установлен. Установите: pip install pydub")
-
-        # Определяем формат файла по расширению
-        file_ext = os.path.splitext(audio_path)[1].lower()
-        if file_ext == '.mp3':
-            audio = AudioSegment.from_mp3(audio_path)
-        elif file_ext == '.wav':
-            audio = AudioSegment.from_wav(audio_path)
-        else:
-            # Используем универсальный метод для других форматов
-            audio = AudioSegment.from_file(audio_path)
-        
-        total_duration = len(audio) / 1000.0  # конвертируем в секунды
+        # Декодируем файл один раз в 16 кГц mono float32 и режем массив на чанки,
+        # вместо ffmpeg-нарезки во временные файлы и повторного декодирования каждого чанка
+        audio = whisperx.load_audio(audio_path)
+        total_samples = len(audio)
 
         chunk_duration = settings.chunk_duration_minutes * 60  # в секундах
+        chunk_samples = chunk_duration * SAMPLE_RATE
         all_segments = []
-        time_offset = 0
-
-        for i in range(0, int(total_duration), int(chunk_duration)):
-            start_time = i
-            end_time = min(i + chunk_duration, total_duration)
-
-            # Создаём временный чанк аудио
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_chunk:
-                chunk_path = temp_chunk.name
 
-            cmd_chunk = [
-                "ffmpeg", "-y", "-i", audio_path,
-                "-ss", str(start_time), "-t", str(end_time - start_time),
-                "-c", "copy", chunk_path
-            ]
-            subprocess.run(cmd_chunk, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-
-            print(f"  Обрабатываем чанк {i//int(chunk_duration) + 1}...")
-
-            # Транскрибируем чанк
-            segments = self.transcribe_file(chunk_path, time_offset)
+        for i, start in enumerate(range(0, total_samples, chunk_samples)):
+            print(f"  Обрабатываем чанк {i + 1}...")
 
+            # Транскрибируем чанк (срез - это view, без копирования данных)
+            segments = self._transcribe_array(audio[start:start + chunk_samples], start / SAMPLE_RATE)
             all_segments.extend(segments)
-            time_offset += chunk_duration
-
-            # Удаляем временный чанк
-            if os.path.exists(chunk_path):
-                os.remove(chunk_path)
 
         print(f"✅ Транскрипция большого файла завершена: {len(all_segments)} сегментов")
         return all_segments
@@ -248,9 +258,26 @@ class WhisperXService:
         # Загружаем аудио
         audio = whisperx.load_audio(audio_path)
 
+        return self._transcribe_array(audio, time_offset)
+
+    def _transcribe_with_beam(self, audio: np.ndarray) -> dict:
+        """model.transcribe с beam_size этого сервиса, не загружая для него отдельную модель"""
+        with self._inference_lock:
+            default_options = self.model.options
+            if self.beam_size != default_options.beam_size:
+                self.model.options = dataclasses.replace(default_options, beam_size=self.beam_size)
+            try:
+                return self.model.transcribe(audio, batch_size=settings.whisperx_batch_size)
+            finally:
+                self.model.options = default_options
+
+    # Выравнивание (wav2vec2) и VAD - torch-модели: без autograd не строится граф и не хранятся активации
+    @torch.inference_mode()
+    def _transcribe_array(self, audio: np.ndarray, time_offset: float = 0):
+        """Транскрибирует и выравнивает уже декодированное аудио (16 кГц mono float32)"""
         # Транскрибируем аудио
         print("🔧 Выполняем транскрипцию...")
-        result = self.model.transcribe(audio, batch_size=16)
+        result = self._transcribe_with_beam(audio)
 
         detected_language = result.get("language", "unknown")
         print(f"Транскрибация завершена. Язык: {detected_language}")
@@ -1,9 +1,10 @@
 import argparse
-import json
 import os
 import sys
 from pathlib import Path
 
+import orjson
+
 
 def _project_root() -> Path:
     # scripts/transcribe_local.py -> project root
@@ -21,13 +22,9 @@ def seconds_to_srt_time(seconds: float) -> str:
         seconds = 0.0
     if seconds < 0:
         seconds = 0.0
-    ms_total = int(round(seconds * 1000))
-    hours = ms_total // 3_600_000
-    ms_total -= hours * 3_600_000
-    minutes = ms_total // 60_000
-    ms_total -= minutes * 60_000
-    secs = ms_total // 1000
-    ms = ms_total - secs * 1000
+    total_secs, ms = divmod(int(round(seconds * 1000)), 1000)
+    minutes, secs = divmod(total_secs, 60)
+    hours, minutes = divmod(minutes, 60)
     return f"{hours:02d}:{minutes:02d}:{secs:02d},{ms:03d}"
 
 
@@ -61,17 +58,15 @@ def segments_to_plain_text(segments) -> str:
     return "\n".join(seg["text"] for seg in segments).strip() + "\n"
 
 
-def segments_to_srt(segments) -> str:
-    lines = []
+def write_srt(segments, f) -> None:
+    # Пишем блоки сразу в файл, без сборки всего SRT в памяти
     for i, seg in enumerate(segments, start=1):
         start = seconds_to_srt_time(seg.get("start", 0.0))
         end = seconds_to_srt_time(seg.get("end", 0.0))
         text = (seg.get("text") or "").strip()
-        lines.append(str(i))
-        lines.append(f"{start} --> {end}")
-        lines.append(text)
-        lines.append("")  # пустая строка между блоками
-    return "\n".join(lines).rstrip() + "\n"
+        if i > 1:
+            f.write("\n")  # пустая строка между блоками
+        f.write(f"{i}\n{start} --> {end}\n{text}\n")
 
 
 def main():
@@ -132,12 +127,13 @@ def main():
 
     if out_json:
         out_json.parent.mkdir(parents=True, exist_ok=True)
-        out_json.write_text(json.dumps(segments, ensure_ascii=False, indent=2), encoding="utf-8")
+        out_json.write_bytes(orjson.dumps(segments, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
         print(f"✅ JSON сохранён: {out_json}")
 
     if out_srt:
         out_srt.parent.mkdir(parents=True, exist_ok=True)
-        out_srt.write_text(segments_to_srt(segments), encoding="utf-8")
+        with out_srt.open("w", encoding="utf-8") as f:
+            write_srt(segments, f)
         print(f"✅ SRT сохранён: {out_srt}")
 
 
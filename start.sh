@@ -189,6 +189,7 @@ start_worker() {
         --queues=${queue_name} \
         --hostname=${worker_name}@%h \
         --concurrency=1 \
+        -O fair \
         --logfile=${log_file} \
         --pidfile=logs/${queue_name}_worker.pid \
         > /dev/null 2>&1 &
@@ -244,6 +245,7 @@ cleanup() {
     stop_worker "youtube_download"
     stop_worker "transcription"
     stop_worker "no_vocals"
+    stop_worker "proxy_refresh"
 
     if [ ! -z "$API_PID" ]; then
         print_status "Останавливаем API (PID: $API_PID)..."
@@ -262,6 +264,7 @@ print_status "Запускаем воркеры Celery..."
 start_worker "youtube_download" "download_worker"
 start_worker "transcription" "transcription_worker"
 start_worker "no_vocals" "no_vocals_worker"
+start_worker "proxy_refresh" "proxy_worker"
 
 print_success "Все воркеры запущены"
 
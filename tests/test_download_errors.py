@@ -0,0 +1,63 @@
+"""
+Классификация ошибок загрузки: обрыв соединения посреди тела ответа должен считаться временной ошибкой
+"""
+
+import socket
+import threading
+
+import pytest
+import requests
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+tasks = pytest.importorskip("app.tasks")
+
+
+def _serve_truncated_body(server: socket.socket):
+    """Отвечает на один запрос: обещает 1 МБ тела, отдаёт 1 КБ и закрывает соединение"""
+    conn, _ = server.accept()
+    with conn:
+        conn.recv(65536)
+        conn.sendall(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: audio/ogg\r\n"
+            b"Content-Length: 1048576\r\n"
+            b"\r\n" + b"\0" * 1024
+        )
+
+
+@pytest.fixture
+def truncated_url():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    thread = threading.Thread(target=_serve_truncated_body, args=(server,), daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.getsockname()[1]}/file.opus"
+    thread.join(timeout=5)
+    server.close()
+
+
+def test_mid_body_drop_is_transient(truncated_url):
+    with requests.get(truncated_url, stream=True, timeout=5) as response:
+        response.raise_for_status()
+        with pytest.raises(requests.RequestException) as exc_info:
+            for _ in response.iter_content(1 << 20):
+                pass
+
+    assert tasks.is_transient_download_error(exc_info.value)
+
+
+@pytest.mark.parametrize("error", [
+    requests.exceptions.ChunkedEncodingError("Connection broken: IncompleteRead"),
+    ProtocolError("Connection broken: IncompleteRead"),
+    ReadTimeoutError(None, "/file.opus", "Read timed out."),
+])
+def test_urllib3_body_errors_are_transient(error):
+    assert tasks.is_transient_download_error(error)
+
+
+def test_missing_video_is_not_transient():
+    response = requests.Response()
+    response.status_code = 404
+
+    assert not tasks.is_transient_download_error(requests.HTTPError(response=response))